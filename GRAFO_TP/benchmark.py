@@ -0,0 +1,481 @@
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import time
+import tracemalloc
+from types import SimpleNamespace
+
+import numpy as np
+
+import busca
+import decomposicao
+import dinamico
+import etapa2
+import melhoria
+from cache import atomic_write
+from contexto import RoutingContext
+from grafo import graph_from_instance
+from instancia import load_instance, parse_instance
+
+INPUT_DIR = 'instancias'
+BASELINE_PATH = os.path.join('benchmarks', 'baseline.json')
+PHASES = ('parse', 'apsp', 'construction', 'improvement')
+TIME_TOLERANCE = 0.25    # Aumento relativo de tempo/memória tolerado
+MEMORY_TOLERANCE = 0.25
+MIN_SECONDS = 0.25       # Diferenças menores que isso são ruído de medição
+FAMILIES = ('BHW', 'CBMix', 'DI-NEARP', 'mggdb', 'mgval')
+
+
+def family_of(filename):
+    for family in FAMILIES:
+        if filename.startswith(family):
+            return family
+    return None
+
+
+def instance_paths(families=None, input_dir=INPUT_DIR):
+    paths = []
+    for filename in sorted(os.listdir(input_dir)):
+        if not filename.lower().endswith('.dat'):
+            continue
+        if families and family_of(filename) not in families:
+            continue
+        paths.append(os.path.join(input_dir, filename))
+    return paths
+
+
+def bench_parse(paths, repeat=3):
+    # Leitura sem cache: mede só o parser, melhor de `repeat` rodadas
+    total_bytes = sum(os.path.getsize(p) for p in paths)
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for path in paths:
+            parse_instance(path)
+        best = min(best, time.perf_counter() - start)
+    return {
+        'files': len(paths),
+        'bytes': total_bytes,
+        'seconds': best,
+        'files_per_second': len(paths) / best if best else 0,
+        'mb_per_second': total_bytes / 1e6 / best if best else 0,
+    }
+
+
+def bench_relocate(paths):
+    # Tempo até a convergência do relocate, partindo de Clarke & Wright + 2-opt
+    rows = []
+    for path in paths:
+        ctx = etapa2.load_context(path)
+        routes = etapa2.clarke_wright(ctx)
+        routes = [melhoria.two_opt(r, ctx)[0] for r in routes]
+        before = sum(melhoria.calculate_route_cost(r, ctx) for r in routes)
+        start = time.perf_counter()
+        routes = melhoria.relocate(routes, ctx)
+        seconds = time.perf_counter() - start
+        after = sum(melhoria.calculate_route_cost(r, ctx) for r in routes)
+        rows.append({'instance': os.path.basename(path), 'family': family_of(os.path.basename(path)),
+                     'seconds': seconds, 'cost_before': int(before), 'cost_after': int(after)})
+    return rows
+
+
+def allocated_bytes(build):
+    # Memória retida pelo objeto construído (alocações vivas ao final)
+    tracemalloc.start()
+    try:
+        obj = build()
+        size = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    del obj
+    return size
+
+
+def legacy_graph(graph):
+    # O grafo no formato antigo: listas de tuplas e conjuntos de rótulos
+    return SimpleNamespace(
+        vertices=graph.vertices, edges=graph.edges, arcs=graph.arcs,
+        required_vertices=graph.required_vertices, required_edges=graph.required_edges,
+        required_arcs=graph.required_arcs, edge_costs=graph.edge_costs,
+        arc_costs=graph.arc_costs, depot=graph.depot)
+
+
+def bench_memory(paths):
+    # Memória do grafo por instância: formato antigo x representação compacta
+    rows = []
+    for path in paths:
+        instance = load_instance(path)
+        graph = graph_from_instance(instance)
+        rows.append({'instance': os.path.basename(path), 'family': family_of(os.path.basename(path)),
+                     'legacy_bytes': allocated_bytes(lambda: legacy_graph(graph)),
+                     'compact_bytes': allocated_bytes(lambda: graph_from_instance(instance))})
+    return rows
+
+
+def run_phases(path, memory=False):
+    # Leitura, caminhos mínimos, construção e melhoria (como em etapa3), sem
+    # cache em disco. Cada fase registra o tempo e, com `memory`, o pico de
+    # memória alocada durante ela (tracemalloc, que deixa tudo mais lento:
+    # por isso tempo e memória vêm de execuções separadas).
+    record = {}
+
+    def run(phase, build):
+        if memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        try:
+            result = build()
+            record[phase] = {'seconds': time.perf_counter() - start}
+            if memory:
+                record[phase]['peak_bytes'] = tracemalloc.get_traced_memory()[1]
+        finally:
+            if memory:
+                tracemalloc.stop()
+        return result
+
+    def construct(ctx):
+        return ctx, melhoria.orient_routes(etapa2.clarke_wright(ctx), ctx)[0]
+
+    def improve(routes):
+        routes = [melhoria.two_opt(route, ctx)[0] for route in routes]
+        return melhoria.orient_routes(melhoria.relocate(routes, ctx), ctx)[0]
+
+    instance = run('parse', lambda: parse_instance(path))
+    dist, _, _ = run('apsp', lambda: etapa2.shortest_paths(instance))
+    ctx, routes = run('construction', lambda: construct(RoutingContext(instance, dist)))
+    record['construction']['cost'] = sum(melhoria.calculate_route_cost(r, ctx) for r in routes)
+    routes = run('improvement', lambda: improve(routes))
+    record['improvement']['cost'] = sum(melhoria.calculate_route_cost(r, ctx) for r in routes)
+    return record
+
+
+def bench_suite(paths, memory=True, verbose=True):
+    results = {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'machine': platform.machine(),
+        'instances': {},
+    }
+    for path in paths:
+        name = os.path.basename(path)
+        record = run_phases(path)
+        if memory:
+            for phase, entry in run_phases(path, memory=True).items():
+                record[phase]['peak_bytes'] = entry['peak_bytes']
+        record['family'] = family_of(name)
+        results['instances'][name] = record
+        if verbose:
+            print(f"{name:<28} " + '  '.join(f"{p}={record[p]['seconds']:.3f}s" for p in PHASES)
+                  + f"  custo={record['improvement']['cost']}", file=sys.stderr)
+    return results
+
+
+def suite_rows(results):
+    rows = []
+    for name, record in results['instances'].items():
+        row = {'instance': name, 'family': record['family']}
+        for phase in PHASES:
+            row[f"{phase}_s"] = record[phase]['seconds']
+            if 'peak_bytes' in record[phase]:
+                row[f"{phase}_peak"] = record[phase]['peak_bytes']
+        row['construction_cost'] = record['construction']['cost']
+        row['improvement_cost'] = record['improvement']['cost']
+        rows.append(row)
+    return rows
+
+
+def find_regressions(results, baseline, time_tolerance=TIME_TOLERANCE,
+                     memory_tolerance=MEMORY_TOLERANCE, min_seconds=MIN_SECONDS):
+    # Compara com a linha de base as instâncias presentes nas duas: tempo e
+    # pico de memória acima da tolerância (por instância e no total de cada
+    # família) e qualquer aumento de custo
+    flags = []
+    family_time = {}
+    for name, record in sorted(results['instances'].items()):
+        base = baseline['instances'].get(name)
+        if base is None:
+            continue
+        for phase in PHASES:
+            new, old = record[phase], base[phase]
+            if new['seconds'] > old['seconds'] * (1 + time_tolerance) and new['seconds'] - old['seconds'] > min_seconds:
+                flags.append(f"{name} {phase}: tempo {old['seconds']:.3f}s -> {new['seconds']:.3f}s")
+            if 'peak_bytes' in new and 'peak_bytes' in old and new['peak_bytes'] > old['peak_bytes'] * (1 + memory_tolerance):
+                flags.append(f"{name} {phase}: memória {old['peak_bytes']} -> {new['peak_bytes']} bytes")
+            if 'cost' in new and new['cost'] > old['cost']:
+                flags.append(f"{name} {phase}: custo {old['cost']} -> {new['cost']}")
+            acc = family_time.setdefault((record['family'], phase), [0.0, 0.0])
+            acc[0] += old['seconds']
+            acc[1] += new['seconds']
+    for (family, phase), (old, new) in sorted(family_time.items()):
+        if new > old * (1 + time_tolerance) and new - old > min_seconds:
+            flags.append(f"{family} {phase} (total): tempo {old:.3f}s -> {new:.3f}s")
+    return flags
+
+
+def timed_peak(build):
+    # (segundos, pico de memória em bytes), de duas execuções separadas
+    start = time.perf_counter()
+    build()
+    seconds = time.perf_counter() - start
+    tracemalloc.start()
+    try:
+        build()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return seconds, peak
+
+
+def bench_distances(paths):
+    # Matriz completa de caminhos mínimos x DistanceOracle com as linhas do
+    # depósito e dos extremos dos serviços (o que o contexto de roteamento usa)
+    rows = []
+    for path in paths:
+        instance = parse_instance(path)
+        sources = [instance.depot] + [x for s in instance.services() for x in s[2:4]]
+
+        def lazy():
+            oracle = etapa2.distance_oracle(instance)
+            oracle.precompute(sources)
+            return oracle
+
+        full_s, full_peak = timed_peak(lambda: etapa2.shortest_paths(instance))
+        lazy_s, lazy_peak = timed_peak(lazy)
+        rows.append({'instance': os.path.basename(path), 'family': family_of(os.path.basename(path)),
+                     'nodes': instance.n_nodes, 'rows': len(set(sources)),
+                     'full_s': full_s, 'lazy_s': lazy_s, 'full_peak': full_peak, 'lazy_peak': lazy_peak})
+    return rows
+
+
+def random_changes(instance, rng, count):
+    # Alterações (método, argumentos) para IncrementalSolver, alternando os
+    # tipos: custo menor, custo maior, aresta obrigatória nova, serviço
+    # retirado e demanda alterada. É um gerador: cada alteração é sorteada
+    # sobre o estado atual da instância, já com as anteriores aplicadas
+    label = instance.label
+    for step in range(count):
+        tails, heads, costs = instance.travel_arcs()
+        i = rng.randrange(len(tails))
+        u, v, cost = label(tails[i]), label(heads[i]), int(costs[i])
+        kind, section = rng.choice([(kind, getattr(instance, name))
+                                    for kind, name in dinamico.REQUIRED_SECTION.items()
+                                    if len(getattr(instance, name)) > 1])
+        j = rng.randrange(len(section))
+        a, b = rng.sample(range(instance.n_nodes), 2)
+        demand = max(1, int(section.demands[j]))
+        yield [
+            ('set_cost', (u, v, max(1, cost // 2))),
+            ('set_cost', (u, v, 2 * cost + 1)),
+            ('add_link', (label(a), label(b), cost, 'E', demand)),
+            ('remove_service', (kind, section.names[j])),
+            ('set_demand', (kind, section.names[j], 2 * demand)),
+        ][step % 5]
+
+
+def bench_dynamic(paths, changes=5, seed=0):
+    # Alterações aplicadas com IncrementalSolver x re-resolução completa
+    # (caminhos mínimos, Clarke-Wright e busca local) depois de cada uma; a
+    # matriz incremental tem de ser idêntica à recalculada
+    rows = []
+    for path in paths:
+        solver = dinamico.IncrementalSolver(parse_instance(path))
+        rng = random.Random(f"{seed}:{os.path.basename(path)}")
+        row = {'instance': os.path.basename(path), 'family': family_of(os.path.basename(path)),
+               'changes': 0, 'incremental_s': 0.0, 'full_s': 0.0,
+               'incremental_cost': 0, 'full_cost': 0, 'mismatches': 0}
+        for method, args in random_changes(solver.instance, rng, changes):
+            incremental = getattr(solver, method)(*args)
+            full = solver.full_resolve()
+            row['changes'] += 1
+            row['incremental_s'] += incremental['seconds']
+            row['full_s'] += full['seconds']
+            row['mismatches'] += int(not np.array_equal(full['dist'], solver.dist))
+        row['incremental_cost'] = solver.cost
+        row['full_cost'] = full['cost']
+        rows.append(row)
+    return rows
+
+
+def bench_constructors(paths):
+    # Clarke & Wright x sequência gigante + divisão: tempo e custo da
+    # construção e depois da melhoria da Etapa 3 (2-opt + realocação)
+    rows = []
+    for path in paths:
+        ctx = etapa2.load_context(path)
+        row = {'instance': os.path.basename(path), 'family': family_of(os.path.basename(path))}
+        for name, construct in etapa2.CONSTRUCTORS.items():
+            start = time.perf_counter()
+            routes = construct(ctx)
+            row[f"{name}_s"] = time.perf_counter() - start
+            row[f"{name}_cost"] = busca.total_cost(routes, ctx)
+            routes = melhoria.relocate([melhoria.two_opt(route, ctx)[0] for route in routes], ctx)
+            row[f"{name}_improved"] = busca.total_cost(routes, ctx)
+        rows.append(row)
+    return rows
+
+
+def bench_granular(paths, ks):
+    # Melhoria da Etapa 3 (2-opt + realocação) com a vizinhança completa e
+    # com as vizinhanças granulares de cada k, a partir da mesma solução de
+    # Clarke & Wright; o tempo de montar as vizinhanças entra na conta
+    rows = []
+    for path in paths:
+        ctx = etapa2.load_context(path)
+        initial = etapa2.clarke_wright(ctx)
+        row = {'instance': os.path.basename(path), 'family': family_of(os.path.basename(path))}
+        for k in [None] + ks:
+            name = f"k{k}" if k else 'full'
+            start = time.perf_counter()
+            neighbors = melhoria.granular_neighbors(ctx, k) if k else None
+            routes = [melhoria.two_opt(route, ctx, neighbors)[0] for route in initial]
+            routes = melhoria.relocate(routes, ctx, neighbors)
+            row[f"{name}_s"] = time.perf_counter() - start
+            row[f"{name}_cost"] = busca.total_cost(routes, ctx)
+        rows.append(row)
+    return rows
+
+
+def bench_orientation(paths):
+    # Deslocamento economizado pela escolha do sentido das arestas (melhoria.
+    # orient_routes) logo após Clarke & Wright e após 2-opt + realocação, e o
+    # tempo que ela acrescenta em cada ponto
+    rows = []
+    for path in paths:
+        ctx = etapa2.load_context(path)
+        start = time.perf_counter()
+        routes = etapa2.clarke_wright(ctx)
+        construction_s = time.perf_counter() - start
+        construction_cost = busca.total_cost(routes, ctx)
+        start = time.perf_counter()
+        _, construction_saved = melhoria.orient_routes(routes, ctx)
+        construction_orient_s = time.perf_counter() - start
+        start = time.perf_counter()
+        routes = melhoria.relocate([melhoria.two_opt(route, ctx)[0] for route in routes], ctx)
+        improvement_s = time.perf_counter() - start
+        improvement_cost = busca.total_cost(routes, ctx)
+        start = time.perf_counter()
+        _, improvement_saved = melhoria.orient_routes(routes, ctx)
+        improvement_orient_s = time.perf_counter() - start
+        rows.append({'instance': os.path.basename(path), 'family': family_of(os.path.basename(path)),
+                     'construction_cost': construction_cost, 'construction_saved': construction_saved,
+                     'construction_s': construction_s, 'construction_orient_s': construction_orient_s,
+                     'improvement_cost': improvement_cost, 'improvement_saved': improvement_saved,
+                     'improvement_s': improvement_s, 'improvement_orient_s': improvement_orient_s})
+    return rows
+
+
+def bench_decomposition(paths, workers=1):
+    # Decomposição em grupos x resolução da instância inteira (Clarke & Wright
+    # + busca local), partindo do mesmo contexto. stitched_cost é a solução
+    # inteira depois da mesma costura de rotas, para separar o ganho da
+    # costura do ganho da decomposição
+    rows = []
+    for path in paths:
+        ctx = etapa2.load_context(path)
+        start = time.perf_counter()
+        whole = busca.local_search(etapa2.clarke_wright(ctx), ctx)
+        whole_s = time.perf_counter() - start
+        merged, _ = decomposicao.merge_routes(whole, ctx)
+        stitched = [melhoria.two_opt(route, ctx)[0] for route in merged]
+        start = time.perf_counter()
+        routes, summary = decomposicao.decompose(ctx, workers=workers)
+        rows.append({'instance': os.path.basename(path), 'family': family_of(os.path.basename(path)),
+                     'clusters': summary['clusters'], 'whole_s': whole_s,
+                     'decomposed_s': time.perf_counter() - start,
+                     'whole_cost': busca.total_cost(whole, ctx),
+                     'stitched_cost': busca.total_cost(stitched, ctx),
+                     'decomposed_cost': summary['cost']})
+    return rows
+
+
+def print_by_family(rows, columns):
+    totals = {}
+    for row in rows:
+        acc = totals.setdefault(row['family'], dict.fromkeys(columns, 0))
+        for column in columns:
+            acc[column] += row[column]
+    for family, acc in sorted(totals.items()):
+        count = sum(1 for row in rows if row['family'] == family)
+        values = '  '.join(f"{column}={acc[column]:.3f}" if isinstance(acc[column], float)
+                           else f"{column}={acc[column]}" for column in columns)
+        print(f"{family:<10} {count:>4} instâncias  {values}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks das instâncias em instancias/')
+    parser.add_argument('phase', choices=['parse', 'relocate', 'memory', 'suite', 'distances', 'dynamic', 'decomposition', 'constructors', 'granular', 'orientation'])
+    parser.add_argument('--family', action='append', choices=FAMILIES,
+                        help='Restringe a uma família (pode repetir)')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--k', type=int, nargs='+', default=[5, 10, 20, 40],
+                        help='granular: tamanhos de vizinhança a comparar')
+    parser.add_argument('--changes', type=int, default=5, help='dynamic: alterações por instância')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help='decomposition: processos para os grupos')
+    parser.add_argument('--save', metavar='JSON', help='suite: grava os resultados como nova linha de base')
+    parser.add_argument('--baseline', metavar='JSON', nargs='?', const=BASELINE_PATH,
+                        help=f'suite: compara com a linha de base (padrão: {BASELINE_PATH})')
+    parser.add_argument('--no-memory', action='store_true', help='suite: não mede o pico de memória')
+    parser.add_argument('--time-tolerance', type=float, default=TIME_TOLERANCE)
+    parser.add_argument('--memory-tolerance', type=float, default=MEMORY_TOLERANCE)
+    args = parser.parse_args()
+
+    paths = instance_paths(args.family)
+    if args.phase == 'parse':
+        result = bench_parse(paths, args.repeat)
+        print(f"{result['files']} arquivos, {result['bytes'] / 1e6:.2f} MB em {result['seconds']:.3f} s "
+              f"({result['files_per_second']:.0f} arquivos/s, {result['mb_per_second']:.1f} MB/s)")
+    elif args.phase == 'relocate':
+        paths = instance_paths(args.family or ['mgval', 'DI-NEARP'])
+        print_by_family(bench_relocate(paths), ['seconds', 'cost_before', 'cost_after'])
+    elif args.phase == 'memory':
+        print_by_family(bench_memory(paths), ['legacy_bytes', 'compact_bytes'])
+    elif args.phase == 'distances':
+        print_by_family(bench_distances(paths), ['nodes', 'rows', 'full_s', 'lazy_s', 'full_peak', 'lazy_peak'])
+    elif args.phase == 'dynamic':
+        print_by_family(bench_dynamic(paths, args.changes),
+                        ['changes', 'incremental_s', 'full_s', 'incremental_cost', 'full_cost', 'mismatches'])
+    elif args.phase == 'decomposition':
+        paths = instance_paths(args.family or ['DI-NEARP'])
+        print_by_family(bench_decomposition(paths, args.workers),
+                        ['clusters', 'whole_s', 'decomposed_s', 'whole_cost', 'stitched_cost', 'decomposed_cost'])
+    elif args.phase == 'constructors':
+        paths = instance_paths(args.family or ['mggdb', 'mgval'])
+        print_by_family(bench_constructors(paths), [f"{name}_{column}" for name in etapa2.CONSTRUCTORS
+                                                    for column in ('s', 'cost', 'improved')])
+    elif args.phase == 'granular':
+        paths = instance_paths(args.family or ['DI-NEARP', 'mgval'])
+        names = ['full'] + [f"k{k}" for k in args.k]
+        print_by_family(bench_granular(paths, args.k), [f"{name}_{column}" for name in names
+                                                        for column in ('s', 'cost')])
+    elif args.phase == 'orientation':
+        print_by_family(bench_orientation(paths), ['construction_cost', 'construction_saved', 'construction_s',
+                                                   'construction_orient_s', 'improvement_cost', 'improvement_saved',
+                                                   'improvement_s', 'improvement_orient_s'])
+    elif args.phase == 'suite':
+        results = bench_suite(paths, memory=not args.no_memory)
+        rows = suite_rows(results)
+        columns = [f"{phase}_s" for phase in PHASES] + ['construction_cost', 'improvement_cost']
+        if not args.no_memory:
+            columns += [f"{phase}_peak" for phase in PHASES]
+        print_by_family(rows, columns)
+        if args.save:
+            os.makedirs(os.path.dirname(args.save) or '.', exist_ok=True)
+            atomic_write(args.save, lambda f: f.write(json.dumps(results, indent=1).encode()))
+        if args.baseline:
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+            flags = find_regressions(results, baseline, args.time_tolerance, args.memory_tolerance)
+            for flag in flags:
+                print(f"⚠️ Regressão: {flag}")
+            if flags:
+                sys.exit(1)
+            print("Sem regressões em relação à linha de base.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,200 @@
+import argparse
+import multiprocessing
+import os
+import random
+import time
+
+import numpy as np
+
+import perfil
+from etapa2 import clarke_wright, format_solution, load_context, solve_with
+from melhoria import calculate_route_cost, orient_routes, relocate, two_opt
+
+# Busca local iterada (ILS) com orçamento de tempo, em épocas sincronizadas:
+# a cada época, cada processo parte da melhor solução conhecida (incumbente)
+# e faz EPOCH_ITERATIONS rodadas de perturbação + busca local com a sua
+# própria semente, derivada de (seed, época, processo). Ao fim da época o
+# melhor resultado (empates: menor índice de processo) vira o incumbente de
+# todos. Assim a sequência de incumbentes só depende de seed e do número de
+# processos; o orçamento de tempo decide apenas em que ponto ela para. Com
+# `epochs` e sem `budget`, o resultado é reprodutível.
+
+EPOCH_ITERATIONS = 10  # Rodadas de perturbação por processo em cada época
+STRENGTH = 0.1         # Fração dos serviços retirada e reinserida por perturbação
+MAX_REMOVED = 30
+DEFAULT_BUDGET = 10.0  # Segundos, quando não há orçamento nem número de épocas
+
+_context = None  # Contexto de roteamento de cada processo do pool
+
+
+def total_cost(routes, ctx):
+    return sum(calculate_route_cost(route, ctx) for route in routes)
+
+
+def local_search(routes, ctx, neighbors=None):
+    routes = [two_opt(route, ctx, neighbors)[0] for route in routes]
+    routes = relocate(routes, ctx, neighbors)
+    routes = [two_opt(route, ctx, neighbors)[0] for route in routes]
+    return orient_routes(routes, ctx)[0]
+
+
+def cheapest_insertion(route, t, ctx):
+    # (variação, posição, orientação) mais barata para inserir t na rota
+    route = np.asarray(route, dtype=np.int64)
+    if route.size:
+        base = np.concatenate([ctx.from_depot[route[:1]], ctx.deadhead[route[:-1], route[1:]],
+                               ctx.to_depot[route[-1:]]])
+    else:
+        base = np.zeros(1, dtype=np.int64)
+    best = None
+    for oriented in ((t,) if ctx.flip(t) == t else (t, ctx.flip(t))):
+        arrive = np.concatenate([ctx.from_depot[oriented:oriented + 1], ctx.deadhead[route, oriented]])
+        leave = np.concatenate([ctx.deadhead[oriented, route], ctx.to_depot[oriented:oriented + 1]])
+        delta = arrive + leave - base
+        q = int(delta.argmin())
+        if best is None or delta[q] < best[0]:
+            best = (int(delta[q]), q, oriented)
+    return best
+
+
+def reinsert(routes, tokens, ctx):
+    # Insere cada serviço de `tokens`, na ordem dada, na posição mais barata
+    # entre as rotas com folga (ou numa rota nova, se nenhuma comportar)
+    routes = [route[:] for route in routes]
+    loads = [sum(ctx.demand_list[t >> 1] for t in route) for route in routes]
+    for t in tokens:
+        demand = ctx.demand_list[t >> 1]
+        best = None
+        for r, route in enumerate(routes):
+            if loads[r] + demand > ctx.capacity:
+                continue
+            delta, q, oriented = cheapest_insertion(route, t, ctx)
+            if best is None or delta < best[0]:
+                best = (delta, r, q, oriented)
+        if best is None:
+            routes.append([t])
+            loads.append(demand)
+        else:
+            _, r, q, oriented = best
+            routes[r].insert(q, oriented)
+            loads[r] += demand
+    return [route for route in routes if route]
+
+
+def perturb(routes, ctx, rng, strength=STRENGTH):
+    # Ruína e reconstrução: retira alguns serviços sorteados e os reinsere
+    # em ordem aleatória
+    tokens = [t for route in routes for t in route]
+    k = min(len(tokens), max(2, min(MAX_REMOVED, int(len(tokens) * strength))))
+    removed = set(rng.sample(tokens, k))
+    routes = [[t for t in route if t not in removed] for route in routes]
+    order = sorted(removed)
+    rng.shuffle(order)
+    return reinsert(routes, order, ctx)
+
+
+def _init_worker(ctx):
+    global _context
+    _context = ctx
+
+
+def _run_epoch(routes, cost, seed, iterations, deadline, strength, ctx=None):
+    # Uma época de um processo: ILS a partir do incumbente, aceitando
+    # soluções iguais ou melhores que a corrente
+    ctx = ctx or _context
+    rng = random.Random(seed)
+    current, current_cost = routes, cost
+    best, best_cost = routes, cost
+    done = 0
+    for _ in range(iterations):
+        if deadline is not None and time.monotonic() >= deadline:
+            break
+        candidate = local_search(perturb(current, ctx, rng, strength), ctx)
+        candidate_cost = total_cost(candidate, ctx)
+        done += 1
+        if candidate_cost <= current_cost:
+            current, current_cost = candidate, candidate_cost
+        if candidate_cost < best_cost:
+            best, best_cost = candidate, candidate_cost
+    return best_cost, best, done
+
+
+def search(ctx, routes, budget=None, workers=1, seed=0, epochs=None,
+           iterations=EPOCH_ITERATIONS, strength=STRENGTH):
+    # Devolve (rotas, custo, resumo) com a melhor solução encontrada até o
+    # fim do orçamento (segundos) ou do número de épocas
+    if budget is None and epochs is None:
+        raise ValueError("Informe budget (segundos) ou epochs")
+    deadline = time.monotonic() + budget if budget is not None else None
+    best = local_search(routes, ctx)
+    best_cost = total_cost(best, ctx)
+    summary = {'initial_cost': best_cost, 'epochs': 0, 'iterations': 0, 'history': []}
+
+    pool = multiprocessing.Pool(workers, _init_worker, (ctx,)) if workers > 1 else None
+    try:
+        epoch = 0
+        while ((epochs is None or epoch < epochs)
+               and (deadline is None or time.monotonic() < deadline)):
+            tasks = [(best, best_cost, f"{seed}:{epoch}:{w}", iterations, deadline, strength)
+                     for w in range(workers)]
+            if pool is None:
+                results = [_run_epoch(*task, ctx=ctx) for task in tasks]
+            else:
+                results = pool.starmap(_run_epoch, tasks)
+            for cost, candidate, done in results:
+                summary['iterations'] += done
+                if cost < best_cost:
+                    best, best_cost = candidate, cost
+            epoch += 1
+            summary['history'].append(best_cost)
+        summary['epochs'] = epoch
+    finally:
+        if pool is not None:
+            pool.terminate()
+    return best, best_cost, summary
+
+
+def solve(instance_path, timings=None, trace=None, budget=None, workers=1, seed=0, epochs=None):
+    if budget is None and epochs is None:
+        budget = DEFAULT_BUDGET
+
+    def build(ctx):
+        trace = perfil.current()
+        with trace.phase('search'):
+            routes, _, summary = search(ctx, clarke_wright(ctx), budget, workers, seed, epochs)
+        trace.count('epochs', summary['epochs'])
+        trace.count('iterations', summary['iterations'])
+        return routes
+
+    return solve_with(instance_path, build, timings, trace)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Busca local iterada com orçamento de tempo')
+    parser.add_argument('instance')
+    parser.add_argument('--budget', type=float, default=None,
+                        help=f'Segundos de busca (padrão: {DEFAULT_BUDGET:g}, se --epochs não for dado)')
+    parser.add_argument('--epochs', type=int, default=None, help='Número máximo de épocas')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default=None, help='Arquivo da solução (padrão: só imprime o resumo)')
+    args = parser.parse_args()
+
+    budget = args.budget
+    if budget is None and args.epochs is None:
+        budget = DEFAULT_BUDGET
+
+    start_clock = time.process_time()
+    ctx = load_context(args.instance)
+    routes = clarke_wright(ctx)
+    routes, cost, summary = search(ctx, routes, budget, args.workers, args.seed, args.epochs)
+    end_clock = time.process_time()
+    print(f"Custo {summary['initial_cost']} -> {cost} em {summary['epochs']} épocas, "
+          f"{summary['iterations']} iterações ({args.workers} processos)")
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(format_solution(routes, start_clock, end_clock, ctx))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+import hashlib
+import os
+import pickle
+import shutil
+import tempfile
+
+import numpy as np
+
+# Cache em disco das instâncias já lidas e das matrizes de caminhos mínimos.
+# Cada arquivo .dat ganha um diretório identificado pelo hash do seu conteúdo,
+# então qualquer alteração na instância gera uma entrada nova e a antiga acaba
+# removida pela política LRU.
+CACHE_DIR = os.environ.get(
+    'GRAFO_CACHE_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache'),
+)
+CACHE_ENABLED = os.environ.get('GRAFO_CACHE', '1') != '0'
+MAX_CACHE_BYTES = int(os.environ.get('GRAFO_CACHE_MAX_BYTES', 512 * 1024 * 1024))
+
+# Incrementar quando o formato dos objetos guardados mudar.
+CACHE_VERSION = 3
+
+
+_hash_memo = {}
+
+
+def file_hash(path):
+    # Memoiza por (mtime, tamanho) para não reler o arquivo a cada consulta
+    st = os.stat(path)
+    stamp = (st.st_mtime_ns, st.st_size)
+    memo = _hash_memo.get(os.path.abspath(path))
+    if memo and memo[0] == stamp:
+        return memo[1]
+    digest = hashlib.sha1(f"v{CACHE_VERSION}".encode())
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 16), b''):
+            digest.update(block)
+    _hash_memo[os.path.abspath(path)] = (stamp, digest.hexdigest())
+    return digest.hexdigest()
+
+
+def _entry_dir(path):
+    entry = os.path.join(CACHE_DIR, file_hash(path))
+    os.makedirs(entry, exist_ok=True)
+    os.utime(entry)  # Marca o acesso para a política LRU
+    return entry
+
+
+def atomic_write(target, write):
+    # Escreve em um temporário no mesmo diretório e renomeia: leitores
+    # concorrentes nunca enxergam um arquivo pela metade.
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(target), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            write(f)
+        os.replace(tmp, target)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def _dir_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def evict(max_bytes=None):
+    # Remove as entradas acessadas há mais tempo até caber no limite
+    max_bytes = MAX_CACHE_BYTES if max_bytes is None else max_bytes
+    if not os.path.isdir(CACHE_DIR):
+        return
+    entries = []
+    for name in os.listdir(CACHE_DIR):
+        path = os.path.join(CACHE_DIR, name)
+        if os.path.isdir(path):
+            entries.append((os.path.getmtime(path), _dir_size(path), path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        shutil.rmtree(path, ignore_errors=True)
+        total -= size
+
+
+def clear():
+    shutil.rmtree(CACHE_DIR, ignore_errors=True)
+
+
+def cached_object(path, kind, build):
+    # Objeto Python qualquer (instância já lida), guardado com pickle
+    if not CACHE_ENABLED:
+        return build()
+    target = os.path.join(_entry_dir(path), f"{kind}.pkl")
+    try:
+        with open(target, 'rb') as f:
+            return pickle.load(f)
+    except (OSError, EOFError, AttributeError, ImportError, pickle.UnpicklingError):
+        pass
+    value = build()
+    atomic_write(target, lambda f: pickle.dump(value, f, pickle.HIGHEST_PROTOCOL))
+    evict()
+    return value
+
+
+def cached_shortest_paths(path, kind, build):
+    # Matrizes dist/pred em .npy, abertas com memory-map (somente leitura), e o
+    # índice vértice -> linha em pickle. build() devolve (dist, pred, index).
+    if not CACHE_ENABLED:
+        return build()
+    entry = _entry_dir(path)
+    dist_path = os.path.join(entry, f"{kind}.dist.npy")
+    pred_path = os.path.join(entry, f"{kind}.pred.npy")
+    index_path = os.path.join(entry, f"{kind}.index.pkl")
+    try:
+        with open(index_path, 'rb') as f:
+            index = pickle.load(f)
+        dist = np.load(dist_path, mmap_mode='r')
+        pred = np.load(pred_path, mmap_mode='r')
+        return dist, pred, index
+    except (OSError, ValueError, EOFError, AttributeError, ImportError, pickle.UnpicklingError):
+        pass
+    dist, pred, index = build()
+    atomic_write(dist_path, lambda f: np.save(f, np.asarray(dist)))
+    atomic_write(pred_path, lambda f: np.save(f, np.asarray(pred)))
+    # O índice é gravado por último: sua presença indica entrada completa
+    atomic_write(index_path, lambda f: pickle.dump(index, f, pickle.HIGHEST_PROTOCOL))
+    evict()
+    return dist, pred, index
@@ -0,0 +1,226 @@
+import heapq
+import math
+from collections import OrderedDict
+
+import numpy as np
+
+from componentes import strongly_connected_components
+
+# Distâncias são guardadas em matrizes int64; pares inalcançáveis recebem INF.
+# O valor deixa folga para somar três INF sem overflow, então d[i][k] + d[k][j]
+# nunca "dá a volta". Matrizes float usam np.inf, que também satisfaz d >= INF.
+INF = np.iinfo(np.int64).max // 4
+
+# Razão aproximada entre o custo de uma operação do laço Python do Dijkstra e
+# o de um elemento processado pelo NumPy no Floyd-Warshall (medida nas
+# instâncias BHW, mggdb e DI-NEARP).
+PYTHON_NUMPY_RATIO = 12
+
+# Linhas mantidas pelo DistanceOracle antes de descartar a menos usada
+ORACLE_ROWS = 2048
+
+
+def build_csr(n, tails, heads, weights):
+    # Lista de adjacência compacta (CSR): os vizinhos de u ficam em
+    # targets[offsets[u]:offsets[u + 1]], com os custos em weights.
+    tails = np.asarray(tails, dtype=np.int64)
+    heads = np.asarray(heads, dtype=np.int64)
+    weights = np.asarray(weights)
+    order = np.argsort(tails, kind='stable')
+    offsets = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(tails, minlength=n), out=offsets[1:])
+    return offsets, heads[order], weights[order]
+
+
+def _weight_dtype(weights):
+    weights = np.asarray(weights)
+    if weights.size == 0 or np.issubdtype(weights.dtype, np.integer):
+        return np.int64
+    if np.all(np.mod(weights, 1) == 0):
+        return np.int64
+    return np.float64
+
+
+def _initial_matrices(n, tails, heads, weights, dtype):
+    infinity = INF if dtype == np.int64 else np.inf
+    dist = np.full((n, n), infinity, dtype=dtype)
+    pred = np.full((n, n), -1, dtype=np.int32)
+    tails = np.asarray(tails, dtype=np.int64)
+    heads = np.asarray(heads, dtype=np.int64)
+    weights = np.asarray(weights).astype(dtype)
+    # Arcos paralelos: mantém apenas o mais barato
+    np.minimum.at(dist, (tails, heads), weights)
+    direct = dist < infinity
+    rows = np.nonzero(direct)[0]
+    pred[direct] = rows
+    np.fill_diagonal(dist, 0)
+    np.fill_diagonal(pred, -1)
+    return dist, pred
+
+
+def floyd_warshall(n, tails, heads, weights, prune=False):
+    dtype = _weight_dtype(weights)
+    dist, pred = _initial_matrices(n, tails, heads, weights, dtype)
+    candidate = np.empty_like(dist)
+    improved = np.empty((n, n), dtype=bool)
+    infinity = INF if dtype == np.int64 else np.inf
+
+    # Para cada k a matriz inteira é relaxada de uma vez: a linha k e a coluna k
+    # não mudam na iteração k, então o resultado (inclusive pred) é o mesmo do
+    # laço triplo clássico.
+    for k in range(n):
+        if prune:
+            # Grafo com várias componentes fortes: só os pares (i, j) com i
+            # alcançando k e k alcançando j podem melhorar
+            rows = np.flatnonzero(dist[:, k] < infinity)
+            cols = np.flatnonzero(dist[k] < infinity)
+            if 2 * rows.size * cols.size < n * n:
+                block = np.ix_(rows, cols)
+                current = dist[block]
+                cand = dist[rows, k, None] + dist[k, cols]
+                better = cand < current
+                dist[block] = np.where(better, cand, current)
+                pred[block] = np.where(better, pred[k, cols], pred[block])
+                continue
+        np.add(dist[:, k, None], dist[k], out=candidate)
+        np.less(candidate, dist, out=improved)
+        np.copyto(dist, candidate, where=improved)
+        np.copyto(pred, pred[k], where=improved)
+    return dist, pred
+
+
+def dijkstra(offsets, targets, weights, source, n):
+    # Versão com listas Python (offsets/targets/weights via .tolist()), que é
+    # bem mais rápida que indexar arrays NumPy elemento a elemento.
+    dist = [math.inf] * n
+    pred = [-1] * n
+    dist[source] = 0
+    heap = [(0, source)]
+    while heap:
+        d, u = heapq.heappop(heap)
+        if d > dist[u]:
+            continue
+        for e in range(offsets[u], offsets[u + 1]):
+            v = targets[e]
+            nd = d + weights[e]
+            if nd < dist[v]:
+                dist[v] = nd
+                pred[v] = u
+                heapq.heappush(heap, (nd, v))
+    return dist, pred
+
+
+def repeated_dijkstra(n, tails, heads, weights):
+    dtype = _weight_dtype(weights)
+    infinity = INF if dtype == np.int64 else np.inf
+    offsets, targets, costs = build_csr(n, tails, heads, weights)
+    offsets, targets, costs = offsets.tolist(), targets.tolist(), costs.astype(dtype).tolist()
+    dist = np.empty((n, n), dtype=dtype)
+    pred = np.empty((n, n), dtype=np.int32)
+    for s in range(n):
+        row, prow = dijkstra(offsets, targets, costs, s, n)
+        dist[s] = [infinity if d == math.inf else d for d in row]
+        pred[s] = prow
+    return dist, pred
+
+
+class DistanceOracle:
+    # Distâncias mínimas sob demanda: a linha de uma origem sai de um Dijkstra
+    # com heap na primeira consulta e fica num cache LRU de até max_rows
+    # linhas (None: sem limite). A memória cresce com as origens consultadas
+    # (no roteamento, o depósito e os extremos dos serviços), e não com n².
+    # Indexação: oracle[s] é a linha de s, oracle[s, t] um valor.
+    def __init__(self, n, tails, heads, weights, max_rows=ORACLE_ROWS):
+        self.n = n
+        self.max_rows = max_rows
+        self.dtype = _weight_dtype(weights)
+        self.infinity = INF if self.dtype == np.int64 else np.inf
+        offsets, targets, costs = build_csr(n, tails, heads, weights)
+        self._offsets, self._targets = offsets.tolist(), targets.tolist()
+        self._costs = costs.astype(self.dtype).tolist()
+        self._rows = OrderedDict()
+        self.computed = 0  # Dijkstras executados (linhas descartadas e pedidas de novo contam outra vez)
+
+    def __len__(self):
+        return self.n
+
+    def __getitem__(self, key):
+        if isinstance(key, tuple):
+            source, target = key
+            return self.row(int(source))[target]
+        return self.row(int(key))
+
+    def row(self, source):
+        row = self._rows.get(source)
+        if row is not None:
+            self._rows.move_to_end(source)
+            return row
+        dist, _ = dijkstra(self._offsets, self._targets, self._costs, source, self.n)
+        row = np.array([self.infinity if d == math.inf else d for d in dist], dtype=self.dtype)
+        row.flags.writeable = False
+        self._rows[source] = row
+        self.computed += 1
+        if self.max_rows is not None and len(self._rows) > self.max_rows:
+            self._rows.popitem(last=False)
+        return row
+
+    def precompute(self, sources):
+        # Calcula de uma vez as linhas ainda ausentes das origens dadas
+        for source in dict.fromkeys(np.asarray(sources, dtype=np.int64).ravel().tolist()):
+            self.row(source)
+
+    def submatrix(self, sources, targets):
+        # Equivale a dist[np.ix_(sources, targets)]: cada origem distinta é
+        # calculada uma vez e já recortada nas colunas pedidas
+        sources = np.asarray(sources, dtype=np.int64).ravel()
+        targets = np.asarray(targets, dtype=np.int64).ravel()
+        unique, inverse = np.unique(sources, return_inverse=True)
+        block = np.empty((len(unique), len(targets)), dtype=self.dtype)
+        for i, source in enumerate(unique.tolist()):
+            block[i] = self.row(source)[targets]
+        return block[inverse.ravel()]
+
+
+def choose_method(n, m):
+    # Floyd-Warshall custa n³ operações vetorizadas; o Dijkstra repetido custa
+    # cerca de n·(n + m)·log n operações interpretadas.
+    if n < 2:
+        return 'floyd_warshall'
+    dijkstra_cost = PYTHON_NUMPY_RATIO * n * (n + m) * math.log2(n)
+    return 'dijkstra' if dijkstra_cost < n ** 3 else 'floyd_warshall'
+
+
+def all_pairs_shortest_paths(n, tails, heads, weights, method='auto', region=None):
+    # region (opcional): ids dos vértices de interesse. Os caminhos são
+    # calculados só no subgrafo induzido por eles; os demais pares ficam INF.
+    if region is not None:
+        return _restricted_shortest_paths(n, tails, heads, weights, method, np.asarray(region))
+    if method == 'auto':
+        method = choose_method(n, len(tails))
+    if method == 'floyd_warshall':
+        offsets, targets, _ = build_csr(n, tails, heads, weights)
+        _, count = strongly_connected_components(n, offsets, targets)
+        return floyd_warshall(n, tails, heads, weights, prune=count > 1)
+    if method == 'dijkstra':
+        return repeated_dijkstra(n, tails, heads, weights)
+    raise ValueError(f"Método de caminhos mínimos desconhecido: {method}")
+
+
+def _restricted_shortest_paths(n, tails, heads, weights, method, region):
+    tails = np.asarray(tails, dtype=np.int64)
+    heads = np.asarray(heads, dtype=np.int64)
+    weights = np.asarray(weights)
+    local = np.full(n, -1, dtype=np.int64)
+    local[region] = np.arange(region.size)
+    keep = (local[tails] >= 0) & (local[heads] >= 0)
+    sub_dist, sub_pred = all_pairs_shortest_paths(
+        region.size, local[tails[keep]], local[heads[keep]], weights[keep], method)
+
+    infinity = INF if sub_dist.dtype == np.int64 else np.inf
+    dist = np.full((n, n), infinity, dtype=sub_dist.dtype)
+    pred = np.full((n, n), -1, dtype=np.int32)
+    block = np.ix_(region, region)
+    dist[block] = sub_dist
+    pred[block] = np.where(sub_pred >= 0, region[np.maximum(sub_pred, 0)], -1)
+    np.fill_diagonal(dist, 0)
+    return dist, pred
@@ -0,0 +1,105 @@
+import numpy as np
+
+# Componentes conexas sobre listas de adjacência CSR (offsets/targets, como
+# as de caminhos.build_csr). Todas as buscas são iterativas, com pilha
+# explícita, para não esbarrar no limite de recursão em grafos profundos.
+
+
+def strongly_connected_components(n, offsets, targets):
+    # Tarjan iterativo. Devolve (rótulo da componente de cada vértice, nº de
+    # componentes); os rótulos saem em ordem topológica reversa da condensação
+    # (componentes "sumidouro" primeiro).
+    offsets = offsets.tolist() if hasattr(offsets, 'tolist') else offsets
+    targets = targets.tolist() if hasattr(targets, 'tolist') else targets
+    index = [-1] * n
+    low = [0] * n
+    on_stack = [False] * n
+    component = [-1] * n
+    stack = []
+    counter = 0
+    count = 0
+
+    for root in range(n):
+        if index[root] >= 0:
+            continue
+        index[root] = low[root] = counter
+        counter += 1
+        stack.append(root)
+        on_stack[root] = True
+        work = [[root, offsets[root]]]  # (vértice, próxima aresta a examinar)
+        while work:
+            frame = work[-1]
+            v, e = frame
+            if e < offsets[v + 1]:
+                frame[1] = e + 1
+                w = targets[e]
+                if index[w] < 0:
+                    index[w] = low[w] = counter
+                    counter += 1
+                    stack.append(w)
+                    on_stack[w] = True
+                    work.append([w, offsets[w]])
+                elif on_stack[w] and index[w] < low[v]:
+                    low[v] = index[w]
+                continue
+
+            work.pop()
+            if work:
+                parent = work[-1][0]
+                if low[v] < low[parent]:
+                    low[parent] = low[v]
+            if low[v] == index[v]:
+                while True:
+                    w = stack.pop()
+                    on_stack[w] = False
+                    component[w] = count
+                    if w == v:
+                        break
+                count += 1
+
+    return np.array(component, dtype=np.int32), count
+
+
+def weakly_connected_components(n, tails, heads):
+    # Union-find sobre as ligações, ignorando o sentido. Rótulos 0..count-1
+    # na ordem do menor vértice de cada componente.
+    parent = list(range(n))
+
+    def find(x):
+        root = x
+        while parent[root] != root:
+            root = parent[root]
+        while parent[x] != root:
+            parent[x], x = root, parent[x]
+        return root
+
+    for u, v in zip(np.asarray(tails).tolist(), np.asarray(heads).tolist()):
+        ru, rv = find(u), find(v)
+        if ru != rv:
+            parent[max(ru, rv)] = min(ru, rv)
+
+    roots = np.array([find(x) for x in range(n)], dtype=np.int64)
+    _, labels = np.unique(roots, return_inverse=True)
+    return labels.astype(np.int32), int(labels.max()) + 1 if n else 0
+
+
+def condensation(offsets, targets, component, count):
+    # DAG das componentes fortemente conexas, também em CSR (sem arcos
+    # repetidos nem laços)
+    offsets = np.asarray(offsets)
+    targets = np.asarray(targets)
+    tails = np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+    ct, ch = component[tails], component[targets]
+    keep = ct != ch
+    pairs = np.unique(ct[keep].astype(np.int64) * count + ch[keep])
+    dag_tails, dag_heads = pairs // count, pairs % count
+    dag_offsets = np.zeros(count + 1, dtype=np.int64)
+    np.cumsum(np.bincount(dag_tails, minlength=count), out=dag_offsets[1:])
+    return dag_offsets, dag_heads
+
+
+def strong_region(n, offsets, targets, vertex):
+    # Vértices que alcançam `vertex` e são alcançados por ele (sua componente
+    # fortemente conexa)
+    component, _ = strongly_connected_components(n, offsets, targets)
+    return np.flatnonzero(component == component[vertex])
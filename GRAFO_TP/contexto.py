@@ -0,0 +1,116 @@
+import numpy as np
+
+
+def _submatrix(dist, rows, cols):
+    if hasattr(dist, 'submatrix'):
+        return dist.submatrix(rows, cols)
+    return np.asarray(dist)[np.ix_(rows, cols)]
+
+
+class RoutingContext:
+    # Tudo que as rotinas de roteamento consultam, montado uma vez por
+    # instância. Serviços são índices inteiros k = 0..S-1 (id de saída k + 1)
+    # e cada um tem duas orientações t = 2k (u -> v) e t = 2k + 1 (v -> u);
+    # só arestas obrigatórias podem usar a segunda (ver flip). Uma rota é uma
+    # lista de orientações t.
+    #
+    # deadhead[t1, t2]: deslocamento do fim de t1 ao início de t2
+    # from_depot[t] / to_depot[t]: do depósito ao início de t / do fim de t ao depósito
+    def __init__(self, instance, dist):
+        services = list(instance.services())
+        self.capacity = instance.capacity
+        self.depot = instance.depot
+        self.labels = instance.labels
+        self.ids = np.array([s[0] for s in services], dtype=np.int64)
+        self.flippable = np.array([s[1] == 'E' for s in services], dtype=bool)
+        self.demand = np.array([s[4] for s in services], dtype=np.int64)
+        self.cost = np.array([s[5] for s in services], dtype=np.int64)
+
+        u = np.array([s[2] for s in services], dtype=np.int64)
+        v = np.array([s[3] for s in services], dtype=np.int64)
+        self.start_node = np.empty(2 * len(services), dtype=np.int64)
+        self.end_node = np.empty(2 * len(services), dtype=np.int64)
+        self.start_node[0::2], self.start_node[1::2] = u, v
+        self.end_node[0::2], self.end_node[1::2] = v, u
+
+        # dist: matriz n x n ou caminhos.DistanceOracle (só as linhas do
+        # depósito e dos fins de serviço são consultadas)
+        self.deadhead = _submatrix(dist, self.end_node, self.start_node)
+        self.from_depot = _submatrix(dist, [self.depot], self.start_node)[0]
+        self.to_depot = _submatrix(dist, self.end_node, [self.depot])[:, 0]
+
+        # Versões em listas Python para os laços das heurísticas
+        self.flippable_list = self.flippable.tolist()
+        self.demand_list = self.demand.tolist()
+        self.cost_list = self.cost.tolist()
+        self.from_depot_list = self.from_depot.tolist()
+        self.to_depot_list = self.to_depot.tolist()
+
+    def restrict(self, services):
+        # Contexto só com os serviços dados (índices k deste contexto), que
+        # passam a ser 0..len(services)-1 na mesma ordem; tokens(services)
+        # converte de volta as orientações do contexto menor
+        services = np.asarray(services, dtype=np.int64)
+        tokens = self.tokens(services)
+        sub = object.__new__(RoutingContext)
+        sub.capacity, sub.depot, sub.labels = self.capacity, self.depot, self.labels
+        sub.ids = self.ids[services]
+        sub.flippable = self.flippable[services]
+        sub.demand = self.demand[services]
+        sub.cost = self.cost[services]
+        sub.start_node = self.start_node[tokens]
+        sub.end_node = self.end_node[tokens]
+        sub.deadhead = self.deadhead[np.ix_(tokens, tokens)]
+        sub.from_depot = self.from_depot[tokens]
+        sub.to_depot = self.to_depot[tokens]
+        sub.flippable_list = sub.flippable.tolist()
+        sub.demand_list = sub.demand.tolist()
+        sub.cost_list = sub.cost.tolist()
+        sub.from_depot_list = sub.from_depot.tolist()
+        sub.to_depot_list = sub.to_depot.tolist()
+        return sub
+
+    @staticmethod
+    def tokens(services):
+        # Orientações (2k, 2k + 1) de cada serviço, intercaladas
+        services = np.asarray(services, dtype=np.int64)
+        return np.stack([2 * services, 2 * services + 1], axis=1).ravel()
+
+    def service_distances(self):
+        # Distância simétrica entre serviços (S x S): o menor deslocamento
+        # entre as orientações de um e de outro, em qualquer ordem
+        n = self.n_services
+        d = self.deadhead.reshape(n, 2, n, 2).min(axis=(1, 3))
+        return np.minimum(d, d.T)
+
+    def nearest_services(self, k):
+        # Os k serviços mais próximos de cada um por service_distances (S x k,
+        # do mais próximo ao mais distante), por seleção parcial
+        d = self.service_distances()
+        np.fill_diagonal(d, np.iinfo(d.dtype).max)
+        k = min(k, self.n_services - 1)
+        if k <= 0:
+            return np.zeros((self.n_services, 0), dtype=np.int64)
+        near = np.argpartition(d, k - 1, axis=1)[:, :k]
+        order = np.argsort(np.take_along_axis(d, near, axis=1), axis=1, kind='stable')
+        return np.take_along_axis(near, order, axis=1)
+
+    @property
+    def n_services(self):
+        return len(self.ids)
+
+    def local_matrix(self, tokens):
+        # Deslocamentos só entre as orientações dadas, em listas Python: a
+        # posição 0 é o depósito e tokens[i] fica na posição i + 1
+        tokens = np.asarray(tokens, dtype=np.int64)
+        m = np.zeros((len(tokens) + 1, len(tokens) + 1), dtype=np.int64)
+        m[1:, 1:] = self.deadhead[np.ix_(tokens, tokens)]
+        m[0, 1:] = self.from_depot[tokens]
+        m[1:, 0] = self.to_depot[tokens]
+        return m.tolist()
+
+    def flip(self, t):
+        return t ^ 1 if self.flippable_list[t >> 1] else t
+
+    def service_id(self, t):
+        return int(self.ids[t >> 1])
@@ -0,0 +1,185 @@
+import argparse
+import math
+import multiprocessing
+import os
+import time
+
+import numpy as np
+
+import perfil
+from busca import local_search, total_cost
+from etapa2 import clarke_wright, format_solution, load_context, solve_with
+from melhoria import relocate, two_opt
+
+# Decomposição "agrupar primeiro, rotear depois" para instâncias grandes: os
+# serviços são divididos em grupos por k-medoids sobre os deslocamentos entre
+# eles (as instâncias não têm coordenadas, então não há varredura angular a
+# partir do depósito), cada grupo é resolvido à parte por Clarke & Wright e
+# busca local num pool de processos; depois as rotas da fronteira entre
+# grupos passam por realocação entre si e as rotas que cabem juntas são
+# concatenadas (com 2-opt nas resultantes). Os subproblemas são bem menores
+# que o todo, e a realocação, que cresce mais que linearmente com o número de
+# serviços, só vê serviços de grupos diferentes nas rotas de fronteira.
+
+CLUSTER_SERVICES = 200  # Serviços por grupo, quando o número de grupos é automático
+MEDOID_ITERATIONS = 20
+
+
+def k_medoids(dist, k, seed=0):
+    # Agrupamento de Voronoi: sementes como no k-means++ e, até estabilizar,
+    # cada ponto vai para o medoide mais próximo e cada grupo troca o medoide
+    # pelo membro de menor soma de distâncias aos demais
+    n = len(dist)
+    k = max(1, min(k, n))
+    rng = np.random.default_rng(seed)
+    weights = dist.astype(np.float64)
+    medoids = [int(rng.integers(n))]
+    for _ in range(k - 1):
+        nearest = weights[:, medoids].min(axis=1)
+        total = nearest.sum()
+        if total <= 0:
+            break
+        medoids.append(int(rng.choice(n, p=nearest / total)))
+    medoids = np.array(medoids)
+
+    labels = dist[:, medoids].argmin(axis=1)
+    for _ in range(MEDOID_ITERATIONS):
+        for c in range(len(medoids)):
+            members = np.flatnonzero(labels == c)
+            if members.size:
+                medoids[c] = members[dist[np.ix_(members, members)].sum(axis=1).argmin()]
+        new_labels = dist[:, medoids].argmin(axis=1)
+        if np.array_equal(new_labels, labels):
+            break
+        labels = new_labels
+    return labels, medoids
+
+
+def solve_cluster(sub):
+    # Construção e melhoria de um grupo, nas orientações do contexto restrito
+    return local_search(clarke_wright(sub), sub)
+
+
+def merge_routes(routes, ctx):
+    # Concatena pares de rotas (fim de uma, início da outra) enquanto houver
+    # economia e a carga couber, o melhor par primeiro
+    routes = [route[:] for route in routes]
+    loads = np.array([sum(ctx.demand_list[t >> 1] for t in route) for route in routes], dtype=np.int64)
+    merges = 0
+    while len(routes) > 1:
+        first = np.array([route[0] for route in routes])
+        last = np.array([route[-1] for route in routes])
+        saving = (ctx.to_depot[last][:, None] + ctx.from_depot[first][None, :]
+                  - ctx.deadhead[np.ix_(last, first)])
+        saving[loads[:, None] + loads[None, :] > ctx.capacity] = -1
+        np.fill_diagonal(saving, -1)
+        a, b = np.unravel_index(saving.argmax(), saving.shape)
+        if saving[a, b] <= 0:
+            break
+        routes[a] = routes[a] + routes[b]
+        loads[a] += loads[b]
+        del routes[b]
+        loads = np.delete(loads, b)
+        merges += 1
+    return routes, merges
+
+
+def boundary_services(dist, labels):
+    # Serviços cujo vizinho mais próximo em outro grupo está tão perto quanto
+    # o mais próximo no próprio grupo
+    d = dist.astype(np.float64)
+    np.fill_diagonal(d, np.inf)
+    same = labels[:, None] == labels[None, :]
+    own = np.where(same, d, np.inf).min(axis=1)
+    other = np.where(same, np.inf, d).min(axis=1)
+    return other <= own
+
+
+def decompose(ctx, clusters=None, workers=1, seed=0):
+    # Devolve (rotas, resumo); clusters=None escolhe ~CLUSTER_SERVICES
+    # serviços por grupo
+    trace = perfil.current()
+    if clusters is None:
+        clusters = max(1, math.ceil(ctx.n_services / CLUSTER_SERVICES))
+    with trace.phase('cluster'):
+        dist = ctx.service_distances()
+        labels, _ = k_medoids(dist, clusters, seed)
+        groups = [np.flatnonzero(labels == c) for c in range(labels.max() + 1)]
+        groups = [group for group in groups if group.size]
+        subs = [ctx.restrict(group) for group in groups]
+
+    with trace.phase('subproblems'):
+        if workers > 1 and len(subs) > 1:
+            with multiprocessing.Pool(min(workers, len(subs))) as pool:
+                solved = pool.map(solve_cluster, subs)
+        else:
+            solved = [solve_cluster(sub) for sub in subs]
+    routes = []
+    for group, cluster_routes in zip(groups, solved):
+        tokens = ctx.tokens(group)
+        routes += [tokens[route].tolist() for route in cluster_routes]
+    clustered_cost = total_cost(routes, ctx)
+    n_routes = len(routes)
+
+    with trace.phase('polish'):
+        # Rotas de fronteira (com algum serviço tão perto de outro grupo
+        # quanto do próprio): realocação entre elas, ainda curtas
+        edge = boundary_services(dist, labels)
+        is_border = [any(edge[t >> 1] for t in route) for route in routes]
+        border = [route for route, flag in zip(routes, is_border) if flag]
+        inner = [route for route, flag in zip(routes, is_border) if not flag]
+        routes = inner + relocate(border, ctx)
+
+    with trace.phase('stitch'):
+        # Concatenação de rotas que cabem juntas, seguida de 2-opt nas rotas
+        # que resultaram de alguma concatenação
+        merged, merges = merge_routes(routes, ctx)
+        unchanged = {tuple(route) for route in routes}
+        routes = [route if tuple(route) in unchanged else two_opt(route, ctx)[0] for route in merged]
+
+    trace.count('clusters', len(groups))
+    trace.count('stitch_merges', merges)
+    trace.count('boundary_routes', len(border))
+    summary = {'clusters': len(groups), 'sizes': [int(g.size) for g in groups],
+               'clustered_routes': n_routes, 'clustered_cost': clustered_cost,
+               'merges': merges, 'boundary_routes': len(border), 'cost': total_cost(routes, ctx)}
+    return routes, summary
+
+
+def solve(instance_path, timings=None, trace=None, clusters=None, workers=1, seed=0):
+    return solve_with(instance_path, lambda ctx: decompose(ctx, clusters, workers, seed)[0], timings, trace)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Resolução por decomposição em grupos de serviços')
+    parser.add_argument('instance')
+    parser.add_argument('--clusters', type=int, default=None,
+                        help=f'Número de grupos (padrão: um a cada {CLUSTER_SERVICES} serviços)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--compare', action='store_true',
+                        help='Resolve também a instância inteira (Clarke & Wright + busca local)')
+    parser.add_argument('--output', default=None, help='Arquivo da solução (padrão: só imprime o resumo)')
+    args = parser.parse_args()
+
+    start_clock = time.process_time()
+    ctx = load_context(args.instance)
+    start = time.perf_counter()
+    routes, summary = decompose(ctx, args.clusters, args.workers, args.seed)
+    seconds = time.perf_counter() - start
+    end_clock = time.process_time()
+    print(f"{summary['clusters']} grupos {summary['sizes']}: custo {summary['clustered_cost']} "
+          f"({summary['clustered_routes']} rotas) -> {summary['cost']} ({len(routes)} rotas, "
+          f"{summary['merges']} costuras, {summary['boundary_routes']} rotas de fronteira) em {seconds:.2f} s")
+    if args.compare:
+        start = time.perf_counter()
+        whole = local_search(clarke_wright(ctx), ctx)
+        print(f"Instância inteira: custo {total_cost(whole, ctx)} ({len(whole)} rotas) "
+              f"em {time.perf_counter() - start:.2f} s")
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(format_solution(routes, start_clock, end_clock, ctx))
+
+
+if __name__ == '__main__':
+    main()
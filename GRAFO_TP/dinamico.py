@@ -0,0 +1,258 @@
+import copy
+import time
+
+import numpy as np
+
+import instancia
+from busca import local_search, reinsert, total_cost
+from caminhos import INF, DistanceOracle, all_pairs_shortest_paths
+from contexto import RoutingContext
+from etapa2 import clarke_wright
+
+# Re-resolução incremental de uma instância que muda aos poucos (custos de
+# ligações, ligações novas, serviços incluídos ou retirados, demandas). As
+# distâncias são atualizadas em vez de recalculadas: uma ligação que fica
+# mais barata (ou nova) custa O(n²) com NumPy; uma que fica mais cara só
+# refaz, por Dijkstra, as linhas das origens cujo caminho mínimo podia
+# passar por ela, desde que sejam no máximo REPAIR_FRACTION das origens.
+# As rotas anteriores são o ponto de partida: serviços novos ou que não
+# cabem mais são reinseridos e a busca local de melhoria é reaplicada.
+
+REPAIR_FRACTION = 0.25
+
+# Tipo de serviço -> seção obrigatória; tipo de ligação -> (obrigatória, comum)
+REQUIRED_SECTION = {'N': 'required_nodes', 'E': 'required_edges', 'A': 'required_arcs'}
+LINK_SECTIONS = {'E': ('required_edges', 'edges'), 'A': ('required_arcs', 'arcs')}
+
+
+def decrease_update(dist, tail, head, weight):
+    # Arco tail -> head passa a custar `weight`: d(i, j) = min(d(i, j),
+    # d(i, tail) + weight + d(head, j)) para todos os pares de uma vez
+    through = dist[:, tail, None] + weight + dist[None, head, :]
+    np.minimum(dist, through, out=dist)
+
+
+def affected_sources(dist, tail, head, old_weight):
+    # Origens com algum caminho mínimo que usava o arco tail -> head
+    tight = (dist[:, tail, None] + old_weight + dist[None, head, :] == dist) & (dist < INF)
+    return np.flatnonzero(tight.any(axis=1))
+
+
+def _append(section, name, tail, head, cost=0, demand=0, service_cost=0):
+    section.names = section.names + [name]
+    section.tails = np.append(section.tails, tail).astype(np.int32)
+    section.heads = np.append(section.heads, head).astype(np.int32)
+    section.costs = np.append(section.costs, cost).astype(np.int64)
+    section.demands = np.append(section.demands, demand).astype(np.int64)
+    section.service_costs = np.append(section.service_costs, service_cost).astype(np.int64)
+
+
+def _delete(section, i):
+    row = (section.names[i], int(section.tails[i]), int(section.heads[i]), int(section.costs[i]),
+           int(section.demands[i]), int(section.service_costs[i]))
+    section.names = section.names[:i] + section.names[i + 1:]
+    for column in ('tails', 'heads', 'costs', 'demands', 'service_costs'):
+        setattr(section, column, np.delete(getattr(section, column), i))
+    return row
+
+
+class IncrementalSolver:
+    # Mantém instância, matriz de distâncias e rotas atuais. Cada alteração
+    # devolve um resumo (tempo, custo, como as distâncias foram atualizadas).
+    def __init__(self, instance, repair_fraction=REPAIR_FRACTION):
+        self.instance = copy.deepcopy(instance)
+        self.repair_fraction = repair_fraction
+        self.dist = self.full_distances()
+        self.ctx = RoutingContext(self.instance, self.dist)
+        self.routes = local_search(clarke_wright(self.ctx), self.ctx)
+        self._added = 0
+
+    @classmethod
+    def from_file(cls, instance_path, **kwargs):
+        return cls(instancia.load_instance(instance_path), **kwargs)
+
+    @property
+    def cost(self):
+        return total_cost(self.routes, self.ctx)
+
+    def full_distances(self):
+        tails, heads, costs = self.instance.travel_arcs()
+        dist, _ = all_pairs_shortest_paths(self.instance.n_nodes, tails, heads, costs)
+        return np.array(dist)
+
+    def _node(self, label):
+        index = self.instance.node_index()
+        if label not in index:
+            raise ValueError(f"Vértice {label} não existe na instância")
+        return index[label]
+
+    def _arc_weights(self, pairs):
+        # Menor custo de travessia direto de cada par (tail, head)
+        tails, heads, costs = self.instance.travel_arcs()
+        weights = []
+        for tail, head in pairs:
+            mask = (tails == tail) & (heads == head)
+            weights.append(int(costs[mask].min()) if mask.any() else None)
+        return weights
+
+    def _service_keys(self):
+        return [(kind, self._section_of_kind(kind).names[i])
+                for kind in ('N', 'E', 'A') for i in range(len(self._section_of_kind(kind)))]
+
+    def _section_of_kind(self, kind):
+        return getattr(self.instance, REQUIRED_SECTION[kind])
+
+    def _find_service(self, kind, name):
+        section = self._section_of_kind(kind)
+        if name not in section.names:
+            raise ValueError(f"Serviço {kind} {name} não existe")
+        return section, section.names.index(name)
+
+    # Distâncias
+
+    def _update_distances(self, pairs, before):
+        # Atualiza a matriz depois que os custos diretos dos pares mudaram de
+        # `before` para o valor atual. Aumentos primeiro (as origens afetadas
+        # são achadas na matriz antiga e refeitas no grafo novo), depois as
+        # reduções sobre a matriz já corrigida
+        after = self._arc_weights(pairs)
+        increased = [(tail, head, old) for (tail, head), old, new in zip(pairs, before, after)
+                     if old is not None and (new is None or new > old)]
+        decreased = [(tail, head, new) for (tail, head), old, new in zip(pairs, before, after)
+                     if new is not None and (old is None or new < old)]
+        mode, repaired = None, 0
+        if increased:
+            sources = set()
+            for tail, head, old in increased:
+                sources.update(affected_sources(self.dist, tail, head, old).tolist())
+            repaired = len(sources)
+            if repaired > self.repair_fraction * self.instance.n_nodes:
+                self.dist = self.full_distances()
+                return 'full', repaired
+            tails, heads, costs = self.instance.travel_arcs()
+            oracle = DistanceOracle(self.instance.n_nodes, tails, heads, costs, max_rows=None)
+            for source in sorted(sources):
+                self.dist[source] = oracle.row(source)
+            mode = 'repair'
+        for tail, head, new in decreased:
+            decrease_update(self.dist, tail, head, new)
+            mode = mode or 'decrease'
+        return mode, repaired
+
+    # Rotas
+
+    def _route_keys(self):
+        # Rotas atuais em termos de (tipo, nome) e sentido, que sobrevivem à
+        # renumeração dos serviços
+        keys = self._service_keys()
+        return [[(keys[t >> 1], t & 1) for t in route] for route in self.routes]
+
+    def _restore_routes(self, saved, extra=()):
+        # Recria as rotas no contexto novo: serviços retirados somem, os que
+        # não cabem mais e os novos (`extra`) são reinseridos
+        index = {key: k for k, key in enumerate(self._service_keys())}
+        flippable = self.ctx.flippable_list
+        routes, pending = [], []
+        for route in saved:
+            rebuilt = [2 * index[key] + (rev if flippable[index[key]] else 0)
+                       for key, rev in route if key in index]
+            load = sum(self.ctx.demand_list[t >> 1] for t in rebuilt)
+            while load > self.ctx.capacity:
+                t = rebuilt.pop()
+                load -= self.ctx.demand_list[t >> 1]
+                pending.append(t)
+            routes.append(rebuilt)
+        pending += [2 * index[key] for key in extra]
+        return reinsert([route for route in routes if route], pending, self.ctx)
+
+    def _resolve(self, start, distances=None, saved=None, extra=()):
+        self.ctx = RoutingContext(self.instance, self.dist)
+        routes = self.routes if saved is None else self._restore_routes(saved, extra)
+        self.routes = local_search(routes, self.ctx)
+        mode, repaired = distances or (None, 0)
+        return {'seconds': time.perf_counter() - start, 'cost': self.cost,
+                'distances': mode, 'rows_repaired': repaired}
+
+    # Alterações
+
+    def set_cost(self, u, v, cost):
+        # Novo custo de travessia de todas as ligações entre os rótulos u e v
+        # (arestas em qualquer sentido, arcos só u -> v)
+        start = time.perf_counter()
+        a, b = self._node(u), self._node(v)
+        pairs = set()
+        for kind, names in LINK_SECTIONS.items():
+            for name in names:
+                section = getattr(self.instance, name)
+                mask = (section.tails == a) & (section.heads == b)
+                if kind == 'E':
+                    mask |= (section.tails == b) & (section.heads == a)
+                if mask.any():
+                    pairs.update([(a, b), (b, a)] if kind == 'E' else [(a, b)])
+        if not pairs:
+            raise ValueError(f"Não há ligação entre {u} e {v}")
+        pairs = sorted(pairs)
+        before = self._arc_weights(pairs)
+        for kind, names in LINK_SECTIONS.items():
+            for name in names:
+                section = getattr(self.instance, name)
+                mask = (section.tails == a) & (section.heads == b)
+                if kind == 'E':
+                    mask |= (section.tails == b) & (section.heads == a)
+                section.costs = np.where(mask, cost, section.costs)
+        return self._resolve(start, self._update_distances(pairs, before))
+
+    def add_link(self, u, v, cost, kind='E', demand=0, service_cost=None):
+        # Nova aresta (kind='E') ou arco ('A'); com demanda, vira serviço
+        start = time.perf_counter()
+        a, b = self._node(u), self._node(v)
+        pairs = [(a, b), (b, a)] if kind == 'E' else [(a, b)]
+        before = self._arc_weights(pairs)
+        required, optional = LINK_SECTIONS[kind]
+        self._added += 1
+        name = f"{kind}+{self._added}"
+        if demand:
+            saved = self._route_keys()
+            _append(getattr(self.instance, required), name, a, b, cost, demand,
+                    cost if service_cost is None else service_cost)
+            distances = self._update_distances(pairs, before)
+            return self._resolve(start, distances, saved, extra=[(kind, name)])
+        _append(getattr(self.instance, optional), name, a, b, cost)
+        return self._resolve(start, self._update_distances(pairs, before))
+
+    def add_required_node(self, u, demand, service_cost=0):
+        start = time.perf_counter()
+        a = self._node(u)
+        saved = self._route_keys()
+        self._added += 1
+        name = f"N+{self._added}"
+        _append(self.instance.required_nodes, name, a, a, 0, demand, service_cost)
+        return self._resolve(start, saved=saved, extra=[('N', name)])
+
+    def remove_service(self, kind, name):
+        # O serviço deixa de ser obrigatório; a ligação continua percorrível
+        start = time.perf_counter()
+        saved = self._route_keys()
+        section, i = self._find_service(kind, name)
+        row = _delete(section, i)
+        if kind != 'N':
+            _append(getattr(self.instance, LINK_SECTIONS[kind][1]), row[0], row[1], row[2], row[3])
+        return self._resolve(start, saved=saved)
+
+    def set_demand(self, kind, name, demand):
+        start = time.perf_counter()
+        saved = self._route_keys()
+        section, i = self._find_service(kind, name)
+        section.demands = section.demands.copy()
+        section.demands[i] = demand
+        return self._resolve(start, saved=saved)
+
+    def full_resolve(self):
+        # Referência: distâncias, construção e melhoria refeitas do zero sobre
+        # a instância atual, sem alterar o estado incremental
+        start = time.perf_counter()
+        dist = self.full_distances()
+        ctx = RoutingContext(self.instance, dist)
+        routes = local_search(clarke_wright(ctx), ctx)
+        return {'seconds': time.perf_counter() - start, 'cost': total_cost(routes, ctx),
+                'dist': dist, 'routes': routes}
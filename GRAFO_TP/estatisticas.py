@@ -1,165 +1,368 @@
-from collections import defaultdict, deque
+import heapq
+import random
+from collections import deque
+from functools import cached_property
+
+import numpy as np
+
+import cache
+from caminhos import INF, all_pairs_shortest_paths
+from componentes import strongly_connected_components
+from componentes import weakly_connected_components as _weak_components
+from grafo import as_compact
+
+# Acima deste número de vértices, caminho médio, diâmetro e centralidade são
+# estimados por buscas a partir de algumas origens, sem a matriz n x n
+APPROX_THRESHOLD = 500
+APPROX_SAMPLES = 64   # Origens sorteadas para o caminho médio e a centralidade
+DIAMETER_SWEEPS = 4   # Rodadas de varredura dupla para o diâmetro
+CONFIDENCE_Z = 1.96   # Intervalo de 95% para o caminho médio
 
 def floyd_warshall(graph):
-    nodes = list(graph.vertices)
-    n = len(nodes)
-    index = {node: i for i, node in enumerate(nodes)}  # Mapeia vértices para índices numéricos
-    dist = [[float('inf')] * n for _ in range(n)]      # Matriz de distâncias
-    pred = [[None] * n for _ in range(n)]              # Matriz de predecessores
-    
-    # Inicialização da diagonal (distância para si mesmo é 0)
-    for i in range(n):
-        dist[i][i] = 0
-    
-    # Arestas bidirecionais (atualiza ambas as direções)
-    for u, v in graph.edges:
-        i_u, i_v = index[u], index[v]
-        dist[i_u][i_v] = 1
-        dist[i_v][i_u] = 1  # Bidirecional
-        pred[i_u][i_v] = i_u
-        pred[i_v][i_u] = i_v
-    
-    # Arcos unidirecionais (apenas uma direção)
-    for u, v in graph.arcs:
-        i_u, i_v = index[u], index[v]
-        dist[i_u][i_v] = 1
-        pred[i_u][i_v] = i_u
-    
-    # Atualização das distâncias via vértices intermediários
-    for k in range(n):
-        for i in range(n):
-            for j in range(n):
-                if dist[i][k] + dist[k][j] < dist[i][j]:
-                    dist[i][j] = dist[i][k] + dist[k][j]  # Atualiza distância
-                    pred[i][j] = pred[k][j]                # Atualiza predecessor
-    
-    return dist, pred, index
+    # Arestas bidirecionais entram nas duas direções; arcos apenas em uma.
+    # Todas com peso unitário (distância em número de saltos).
+    graph = as_compact(graph)
+    tails = np.concatenate([graph.edge_tails, graph.edge_heads, graph.arc_tails])
+    heads = np.concatenate([graph.edge_heads, graph.edge_tails, graph.arc_heads])
+    dist, pred = all_pairs_shortest_paths(graph.n_nodes, tails, heads, np.ones(len(tails), dtype=np.int64))
+    return dist, pred, graph.index()
 
 
 def connected_components(graph):
-    adjacency = defaultdict(list)
-    
-    # Trata arcos como bidirecionais (erro!)
-    for u, v in graph.edges:
-        adjacency[u].append(v)
-        adjacency[v].append(u)
-    for u, v in graph.arcs:
-        adjacency[u].append(v)
-        adjacency[v].append(u)  # Incorreto para arcos!
-    
-    # BFS para encontrar componentes
-    visited = set()
-    components = []
-    for node in graph.vertices:
-        if node not in visited:
-            queue = deque([node])
-            component = []
-            while queue:
-                current = queue.popleft()
-                component.append(current)
-                for neighbor in adjacency[current]:
-                    if neighbor not in visited:
-                        visited.add(neighbor)
-                        queue.append(neighbor)
-            components.append(component)
-    
-    return len(components)
+    # Componentes fortemente conexas: arcos só valem no seu sentido
+    graph = as_compact(graph)
+    return strongly_connected_components(graph.n_nodes, graph.out_offsets, graph.out_targets)[1]
+
+
+def weakly_connected_components(graph):
+    # Componentes ignorando o sentido dos arcos
+    graph = as_compact(graph)
+    tails = np.concatenate([graph.edge_tails, graph.arc_tails])
+    heads = np.concatenate([graph.edge_heads, graph.arc_heads])
+    return _weak_components(graph.n_nodes, tails, heads)[1]
 
 
 def calculate_degrees(graph):
-    edge_counts = defaultdict(int)  # Grau por arestas
-    in_degree = defaultdict(int)    # Grau de entrada (arcos)
-    out_degree = defaultdict(int)   # Grau de saída (arcos)
-
-    # Arestas: incrementa grau de ambos os vértices
-    for u, v in graph.edges:
-        edge_counts[u] += 1
-        edge_counts[v] += 1
-
-    # Arcos: atualiza graus de entrada/saída
-    for u, v in graph.arcs:
-        out_degree[u] += 1
-        in_degree[v] += 1
-    
-    # Soma graus totais
-    degrees = {}
-    for node in graph.vertices:
-        e_deg = edge_counts.get(node, 0)
-        i_deg = in_degree.get(node, 0)
-        o_deg = out_degree.get(node, 0)
-        degrees[node] = e_deg + i_deg + o_deg
-
-    min_deg = min(degrees.values()) if degrees else 0
-    max_deg = max(degrees.values()) if degrees else 0
-
-    return min_deg, max_deg
-
-
-def betweenness_centrality(graph, dist, pred, index):
-    betweenness = defaultdict(int)
-    nodes = list(graph.vertices)
-    index_node = {v: k for k, v in index.items()}  # Mapeia índices para nomes
-    
-    for s in range(len(nodes)):
-        for t in range(len(nodes)):
-            if s == t or dist[s][t] == float('inf'):
-                continue
-            
-            # Reconstrói o caminho mais curto
-            current = t
-            path = []
-            while current != s:
-                path.append(index_node[current])
-                current = pred[s][current]  # Usa matriz de predecessores
-                if current is None:
-                    break
-            path.append(index_node[s])
-            path = path[::-1]  # Inverte o caminho
-            
-            # Contabiliza nós intermediários
-            for node in path[1:-1]:
-                betweenness[node] += 1
-    
-    return betweenness
+    # Grau total: arestas contam para os dois extremos, arcos para a saída
+    # de um e a entrada do outro
+    graph = as_compact(graph)
+    if graph.n_nodes == 0:
+        return 0, 0
+    ends = np.concatenate([graph.edge_tails, graph.edge_heads, graph.arc_tails, graph.arc_heads])
+    degrees = np.bincount(ends, minlength=graph.n_nodes)
+    return int(degrees.min()), int(degrees.max())
+
+
+def adjacency(graph, weighted=False):
+    # Lista de adjacência CSR (em listas Python, para os laços de busca).
+    # Sem pesos, cada ligação vale 1; com pesos, usa os custos de travessia.
+    graph = as_compact(graph)
+    weights = graph.out_weights.tolist() if weighted else [1] * len(graph.out_targets)
+    return graph.labels.tolist(), graph.out_offsets.tolist(), graph.out_targets.tolist(), weights
+
+
+def _single_source_bfs(s, offsets, targets, n):
+    # Busca em largura de Brandes: ordem de visita, predecessores em caminhos
+    # mínimos e número de caminhos mínimos (sigma) a partir de s
+    order, preds = [], [[] for _ in range(n)]
+    sigma, dist = [0] * n, [-1] * n
+    sigma[s], dist[s] = 1, 0
+    queue = deque([s])
+    while queue:
+        v = queue.popleft()
+        order.append(v)
+        for e in range(offsets[v], offsets[v + 1]):
+            w = targets[e]
+            if dist[w] < 0:
+                dist[w] = dist[v] + 1
+                queue.append(w)
+            if dist[w] == dist[v] + 1:
+                sigma[w] += sigma[v]
+                preds[w].append(v)
+    return order, preds, sigma
+
+
+def _single_source_dijkstra(s, offsets, targets, weights, n):
+    # Mesmo resultado da BFS acima, para custos de travessia (positivos)
+    order, preds = [], [[] for _ in range(n)]
+    sigma, done, seen = [0] * n, [False] * n, [None] * n
+    sigma[s], seen[s] = 1, 0
+    heap = [(0, s)]
+    while heap:
+        d, v = heapq.heappop(heap)
+        if done[v]:
+            continue
+        done[v] = True
+        order.append(v)
+        for e in range(offsets[v], offsets[v + 1]):
+            w = targets[e]
+            nd = d + weights[e]
+            if seen[w] is None or nd < seen[w]:
+                seen[w] = nd
+                heapq.heappush(heap, (nd, w))
+                sigma[w] = sigma[v]
+                preds[w] = [v]
+            elif nd == seen[w] and not done[w]:
+                sigma[w] += sigma[v]
+                preds[w].append(v)
+    return order, preds, sigma
+
+
+def betweenness_centrality(graph, weighted=False, samples=None, seed=None):
+    # Algoritmo de Brandes: O(n·m) sem pesos (BFS) ou O(n·m·log n) com pesos
+    # (Dijkstra), sem matriz n×n, contando todos os caminhos mínimos de cada
+    # par (s, t) de forma fracionária. Com `samples`, usa apenas essa
+    # quantidade de origens sorteadas (reprodutível com `seed`) e escala o
+    # resultado por n / samples, uma estimativa não enviesada.
+    nodes, offsets, targets, weights = adjacency(graph, weighted)
+    n = len(nodes)
+    sources = range(n)
+    scale = 1.0
+    if samples is not None and samples < n:
+        sources = random.Random(seed).sample(range(n), samples)
+        scale = n / samples
+
+    betweenness = [0.0] * n
+    for s in sources:
+        if weighted:
+            order, preds, sigma = _single_source_dijkstra(s, offsets, targets, weights, n)
+        else:
+            order, preds, sigma = _single_source_bfs(s, offsets, targets, n)
+        delta = [0.0] * n
+        for w in reversed(order):
+            coeff = (1.0 + delta[w]) / sigma[w]
+            for v in preds[w]:
+                delta[v] += sigma[v] * coeff
+            if w != s:
+                betweenness[w] += delta[w]
+    return {node: value * scale for node, value in zip(nodes, betweenness)}
+
+
+def path_summary(dist):
+    # Caminho médio e diâmetro em uma única passada pela matriz: a máscara de
+    # pares alcançáveis e a extração dos valores são feitas uma vez só
+    n = len(dist)
+    values = np.asarray(dist)[np.asarray(dist) < INF]
+    count = values.size - n  # A diagonal (distância 0) não entra na média
+    average = float(values.sum()) / count if count > 0 else 0
+    longest = values.max().item() if values.size else 0
+    return average, longest
 
 
 def average_path_length(dist, n):
-    total = 0
-    count = 0
-    for i in range(n):
-        for j in range(n):
-            if i != j and dist[i][j] != float('inf'):
-                total += dist[i][j]
-                count += 1
-    return total / count if count else 0
+    return path_summary(dist)[0]
 
 
 def diameter(dist, n):
-    max_dist = 0
-    for i in range(n):
-        for j in range(n):
-            if dist[i][j] != float('inf'):
-                max_dist = max(max_dist, dist[i][j])
-    return max_dist
-
-
-def compute_statistics(graph):
-    dist, pred, index = floyd_warshall(graph)
-    n = len(graph.vertices)
-    stats = {
-        'vertices': len(graph.vertices),
-        'edges': len(graph.edges),
-        'arcs': len(graph.arcs),
-        'required_vertices': len(graph.required_vertices),
-        'required_edges': len(graph.required_edges),
-        'required_arcs': len(graph.required_arcs),
-        'density': (len(graph.edges) + len(graph.arcs)) / (len(graph.vertices) * (len(graph.vertices) - 1)) if len(graph.vertices) > 1 else 0,
-        'connected_components': connected_components(graph),
-        'min_degree': calculate_degrees(graph)[0],
-        'max_degree': calculate_degrees(graph)[1],
-        'average_path_length': average_path_length(dist, n),
-        'diameter': diameter(dist, n)
-    }
-    betweenness = betweenness_centrality(graph, dist, pred, index)
-    stats['betweenness'] = betweenness
-    return stats
+    return path_summary(dist)[1]
+
+
+def _bfs_distances(source, offsets, targets, n):
+    # Saltos de source a cada vértice (-1: inalcançável)
+    dist = [-1] * n
+    dist[source] = 0
+    queue = deque([source])
+    while queue:
+        v = queue.popleft()
+        for e in range(offsets[v], offsets[v + 1]):
+            w = targets[e]
+            if dist[w] < 0:
+                dist[w] = dist[v] + 1
+                queue.append(w)
+    return np.array(dist)
+
+
+def diameter_bounds(graph, sweeps=DIAMETER_SWEEPS, seed=0):
+    # Limites (inferior, superior) do diâmetro por varreduras duplas
+    # iteradas, sem a matriz de distâncias. Cada rodada parte de um vértice
+    # u: as buscas de saída e de entrada de u dão ecc_out(u) e ecc_in(u),
+    # ambas limites inferiores, e, se o grafo é fortemente conexo,
+    # ecc_out(u) + ecc_in(u) é um limite superior (todo caminho mínimo pode
+    # passar por u). Depois, a partir do vértice a mais distante de u, a
+    # busca de entrada acha o b que mais demora a chegar em a, e a de saída
+    # de b completa a varredura; a próxima rodada parte do meio de um
+    # caminho mínimo de b a a. Para quando os limites se encontram.
+    graph = as_compact(graph)
+    n = graph.n_nodes
+    if n < 2:
+        return 0, 0
+    out_csr = graph.out_offsets.tolist(), graph.out_targets.tolist()
+    in_csr = graph.in_offsets.tolist(), graph.in_targets.tolist()
+    strongly_connected = connected_components(graph) == 1
+    lower, upper = 0, n - 1
+    u = random.Random(seed).randrange(n)
+    for _ in range(sweeps):
+        from_u = _bfs_distances(u, *out_csr, n)
+        to_u = _bfs_distances(u, *in_csr, n)
+        lower = max(lower, int(from_u.max()), int(to_u.max()))
+        if strongly_connected:
+            upper = min(upper, int(from_u.max()) + int(to_u.max()))
+        if lower >= upper:
+            break
+        a = int(from_u.argmax())
+        to_a = _bfs_distances(a, *in_csr, n)
+        b = int(to_a.argmax())
+        from_b = _bfs_distances(b, *out_csr, n)
+        lower = max(lower, int(to_a.max()), int(from_b.max()))
+        if lower >= upper:
+            break
+        # Meio do caminho b -> a: vértice sobre um caminho mínimo com as
+        # duas metades mais equilibradas
+        on_path = (from_b >= 0) & (to_a >= 0) & (from_b + to_a == from_b[a])
+        candidates = np.flatnonzero(on_path)
+        u = int(candidates[np.abs(from_b[candidates] - to_a[candidates]).argmin()])
+    return lower, upper
+
+
+def sampled_path_length(graph, samples=APPROX_SAMPLES, seed=0):
+    # Caminho médio estimado a partir de `samples` origens sorteadas
+    # (reprodutível com seed): razão entre a soma das distâncias e o número
+    # de pares alcançáveis das origens. Devolve (estimativa, meia largura do
+    # intervalo de 95%), pelo erro padrão do estimador de razão com correção
+    # de população finita; com samples >= n o valor é exato.
+    nodes, offsets, targets, _ = adjacency(graph)
+    n = len(nodes)
+    if n < 2:
+        return 0, 0.0
+    sources = random.Random(seed).sample(range(n), min(samples, n))
+    totals, counts = [], []
+    for s in sources:
+        dist = _bfs_distances(s, offsets, targets, n)
+        reached = dist[dist > 0]
+        totals.append(int(reached.sum()))
+        counts.append(reached.size)
+    totals, counts = np.array(totals, dtype=np.float64), np.array(counts, dtype=np.float64)
+    if counts.sum() == 0:
+        return 0, 0.0
+    estimate = totals.sum() / counts.sum()
+    k = len(sources)
+    if k >= n or k < 2:
+        return float(estimate), 0.0
+    residuals = totals - estimate * counts
+    variance = (residuals ** 2).sum() / (k - 1) / (k * counts.mean() ** 2) * (n - k) / (n - 1)
+    return float(estimate), float(CONFIDENCE_Z * np.sqrt(variance))
+
+
+class GraphStatistics:
+    # Estatísticas calculadas sob demanda: cada métrica é computada no
+    # primeiro acesso e memorizada. Métricas que dependem da matriz de
+    # distâncias (caminho médio e diâmetro) saem de uma única passada.
+    #
+    # No modo aproximado (approximate=True, ou None com mais de
+    # APPROX_THRESHOLD vértices) não há matriz: o diâmetro é o limite
+    # inferior de diameter_bounds, o caminho médio e a centralidade vêm de
+    # `samples` origens sorteadas, e path_bounds informa a margem de erro.
+    METRICS = (
+        'vertices', 'edges', 'arcs', 'required_vertices', 'required_edges', 'required_arcs',
+        'density', 'connected_components', 'weakly_connected_components', 'min_degree', 'max_degree',
+        'average_path_length', 'diameter', 'betweenness',
+    )
+
+    def __init__(self, graph, approximate=None, samples=APPROX_SAMPLES, seed=0):
+        self.graph = as_compact(graph)
+        if approximate is None:
+            approximate = self.graph.n_nodes > APPROX_THRESHOLD
+        self.approximate = approximate
+        self.samples = samples
+        self.seed = seed
+
+    @cached_property
+    def shortest_paths(self):
+        source = getattr(self.graph, 'source', None)
+        if source is not None:
+            return cache.cached_shortest_paths(source, 'saltos', lambda: floyd_warshall(self.graph))
+        return floyd_warshall(self.graph)
+
+    @cached_property
+    def _degrees(self):
+        return calculate_degrees(self.graph)
+
+    @cached_property
+    def _paths(self):
+        if self.approximate:
+            bounds = self.path_bounds
+            return bounds['average_path_length'][0], bounds['diameter'][0]
+        return path_summary(self.shortest_paths[0])
+
+    @cached_property
+    def path_bounds(self):
+        # diameter: (inferior, superior); average_path_length: (valor, meia
+        # largura do intervalo de 95%). No modo exato as margens são nulas.
+        if not self.approximate:
+            average, longest = self._paths
+            return {'diameter': (longest, longest), 'average_path_length': (average, 0.0), 'exact': True}
+        return {'diameter': diameter_bounds(self.graph, seed=self.seed),
+                'average_path_length': sampled_path_length(self.graph, self.samples, self.seed),
+                'exact': False}
+
+    @cached_property
+    def vertices(self):
+        return self.graph.n_nodes
+
+    @cached_property
+    def edges(self):
+        return len(self.graph.edge_tails)
+
+    @cached_property
+    def arcs(self):
+        return len(self.graph.arc_tails)
+
+    @cached_property
+    def required_vertices(self):
+        return len(self.graph.required_nodes)
+
+    @cached_property
+    def required_edges(self):
+        return self.graph.n_required_edges
+
+    @cached_property
+    def required_arcs(self):
+        return self.graph.n_required_arcs
+
+    @cached_property
+    def density(self):
+        n = self.vertices
+        return (self.edges + self.arcs) / (n * (n - 1)) if n > 1 else 0
+
+    @cached_property
+    def connected_components(self):
+        return connected_components(self.graph)
+
+    @cached_property
+    def weakly_connected_components(self):
+        return weakly_connected_components(self.graph)
+
+    @cached_property
+    def min_degree(self):
+        return self._degrees[0]
+
+    @cached_property
+    def max_degree(self):
+        return self._degrees[1]
+
+    @cached_property
+    def average_path_length(self):
+        return self._paths[0]
+
+    @cached_property
+    def diameter(self):
+        return self._paths[1]
+
+    @cached_property
+    def betweenness(self):
+        if self.approximate:
+            return betweenness_centrality(self.graph, samples=self.samples, seed=self.seed)
+        return betweenness_centrality(self.graph)
+
+    def as_dict(self, select=None):
+        names = self.METRICS if select is None else list(select)
+        unknown = [name for name in names if name not in self.METRICS]
+        if unknown:
+            raise ValueError(f"Estatísticas desconhecidas: {', '.join(unknown)}")
+        return {name: getattr(self, name) for name in names}
+
+
+def compute_statistics(graph, select=None, approximate=None, samples=APPROX_SAMPLES, seed=0):
+    # select: lista de métricas desejadas (padrão: todas, ver GraphStatistics.METRICS);
+    # approximate: None escolhe pelo tamanho do grafo (ver APPROX_THRESHOLD)
+    return GraphStatistics(graph, approximate, samples, seed).as_dict(select)
@@ -1,217 +1,340 @@
 import os
-import time
-import re
+from collections import deque
+
+import numpy as np
+
+import cache
+import instancia
+import perfil
+from caminhos import INF, ORACLE_ROWS, DistanceOracle, all_pairs_shortest_paths, build_csr
+from componentes import strong_region
+from contexto import RoutingContext
+from melhoria import orient_routes
 
 INPUT_DIR = 'instancias'
 OUTPUT_DIR = 'solucoes'
 
-class Graph:
-    def __init__(self):
-        self.vertices = set()
-        self.edges = []
-        self.depot = None
-
-class Service:
-    def __init__(self, sid, u, v, demand, cost):
-        self.id = sid
-        self.u = u
-        self.v = v
-        self.demand = demand
-        self.cost = cost
-
-def read_graph(filepath):
-    graph = Graph()
-    with open(filepath, 'r') as file:
-        for line in file:
-            if line.strip().lower().startswith('depot node:'):
-                graph.depot = int(line.strip().split()[-1])
-            elif re.match(r'\d+', line.strip()):
-                tokens = re.split(r'\s+', line.strip())
-                try:
-                    u = int(tokens[0])
-                    v = int(tokens[1])
-                    graph.vertices.update([u, v])
-                    graph.edges.append((u, v))
-                except:
+def service_region(instance):
+    # Arcos de travessia e vértices da componente fortemente conexa do
+    # depósito: toda rota é um circuito por ele, então só eles importam.
+    # Falha se algum serviço estiver fora dela.
+    tails, heads, costs = instance.travel_arcs()
+    n = instance.n_nodes
+    offsets, targets, _ = build_csr(n, tails, heads, costs)
+    region = strong_region(n, offsets, targets, instance.depot)
+    inside = np.zeros(n, dtype=bool)
+    inside[region] = True
+    for sid, _, u, v, _, _ in instance.services():
+        if not (inside[u] and inside[v]):
+            raise ValueError(f"Serviço {sid} ({instance.label(u)}, {instance.label(v)}) "
+                             f"não é alcançável a partir do depósito e de volta")
+    return tails, heads, costs, region
+
+def shortest_paths(instance):
+    # Matrizes indexadas pelo id denso do vértice; idx mapeia rótulo -> id.
+    # Os vértices fora da região do depósito ficam INF.
+    tails, heads, costs, region = service_region(instance)
+    dist, pred = all_pairs_shortest_paths(instance.n_nodes, tails, heads, costs, region=region)
+    return dist, pred, instance.node_index()
+
+def distance_oracle(instance, max_rows=ORACLE_ROWS):
+    # Alternativa sob demanda a shortest_paths: só as linhas consultadas (o
+    # depósito e os fins de serviço, ao montar o contexto) são calculadas.
+    # Caminhos mínimos entre vértices da região nunca saem dela, então o
+    # Dijkstra no grafo inteiro dá as mesmas distâncias.
+    tails, heads, costs, _ = service_region(instance)
+    return DistanceOracle(instance.n_nodes, tails, heads, costs, max_rows)
+
+SAVINGS_CHUNK = 1 << 16  # Pares ordenados por vez no consumo das economias
+
+def savings_chunks(values, first, second, chunk=SAVINGS_CHUNK):
+    # Entrega os índices dos pares em ordem decrescente de (economia, i, j), um
+    # bloco de cerca de `chunk` pares por vez: só o bloco corrente é ordenado,
+    # e se a construção parar cedo (rota única) o resto nunca é ordenado.
+    remaining = np.arange(len(values))
+    while remaining.size:
+        if remaining.size > chunk:
+            rest = values[remaining]
+            threshold = np.partition(rest, rest.size - chunk)[rest.size - chunk]
+            # Empates com o limiar entram todos no bloco atual para manter a
+            # ordem total por (economia, i, j)
+            take = remaining[rest >= threshold]
+            remaining = remaining[rest < threshold]
+        else:
+            take, remaining = remaining, remaining[:0]
+        order = np.lexsort((-second[take], -first[take], -values[take]))
+        yield take[order]
+
+def clarke_wright(ctx):
+    # Rotas como listas de orientações de serviço (ver contexto.RoutingContext);
+    # a construção usa sempre o sentido original (t = 2k)
+    trace = perfil.current()
+    n = ctx.n_services
+    if n == 0:
+        return []
+    starts = ctx.start_node[0::2].tolist()
+    ends = ctx.end_node[0::2].tolist()
+
+    # Economias s(i, j) = d(0, i) + d(0, j) - d(i, j) para todo par i < j
+    # (serviços em ordem de id), calculadas de uma vez com NumPy. A distância
+    # entre os inícios u_i e u_j é deadhead[2i + 1, 2j], pois a orientação
+    # invertida termina em u_i.
+    with trace.phase('savings'):
+        d0 = ctx.from_depot[0::2]
+        first, second = np.triu_indices(n, k=1)
+        values = d0[first] + d0[second] - ctx.deadhead[2 * first + 1, 2 * second]
+
+    # Cada rota é um caminho duplamente ligado entre seus serviços, sem
+    # direção: concatenar ou inverter uma rota só mexe nos extremos. O
+    # union-find leva cada serviço à raiz da sua rota, que guarda extremos,
+    # carga e o rótulo usado na ordem de saída.
+    parent = list(range(n))
+    link_a = [-1] * n
+    link_b = [-1] * n
+    head = list(range(n))                 # Primeiro serviço da rota
+    tail = list(range(n))                 # Último serviço da rota
+    start = starts[:]                     # Vértice inicial da rota
+    end = ends[:]                         # Vértice final da rota
+    demand = ctx.demand_list[:]
+    label = list(range(n))
+    next_label = n
+    routes_left = n
+
+    def find(x):
+        root = x
+        while parent[root] != root:
+            root = parent[root]
+        while parent[x] != root:
+            parent[x], x = root, parent[x]
+        return root
+
+    def link(x, y):
+        if link_a[x] < 0:
+            link_a[x] = y
+        else:
+            link_b[x] = y
+        if link_a[y] < 0:
+            link_a[y] = x
+        else:
+            link_b[y] = x
+
+    # A ordenação dos blocos de economias conta como "savings" e o consumo
+    # deles como "merge"
+    chunks = savings_chunks(values, first, second)
+    scanned = 0
+    while routes_left > 1:
+        with trace.phase('savings'):
+            chunk = next(chunks, None)
+        if chunk is None:
+            break
+        scanned += len(chunk)
+        with trace.phase('merge'):
+            for i, j in zip(first[chunk].tolist(), second[chunk].tolist()):
+                ri, rj = find(i), find(j)
+                if ri == rj:
+                    continue
+                if demand[ri] + demand[rj] > ctx.capacity:
+                    continue
+                if end[ri] == start[rj]:
+                    link(tail[ri], head[rj])
+                    new = (head[ri], tail[rj], start[ri], end[rj])
+                elif end[rj] == start[ri]:
+                    link(tail[rj], head[ri])
+                    new = (head[rj], tail[ri], start[rj], end[ri])
+                elif end[ri] == end[rj]:
+                    link(tail[ri], tail[rj])
+                    new = (head[ri], head[rj], start[ri], start[rj])
+                elif start[ri] == start[rj]:
+                    link(head[ri], head[rj])
+                    new = (tail[ri], tail[rj], end[ri], end[rj])
+                else:
                     continue
-    return graph
-
-def parse_dat_file(filepath):
-    edges = []
-    services = []
-    capacity = None
-    sid = 1
-
-    with open(filepath, 'r') as file:
-        for line in file:
-            line = line.strip()
-            if not line or line.startswith('#'):
-                continue
-            if 'CAPACITY' in line.upper():
-                parts = re.findall(r'\d+', line)
-                if parts:
-                    capacity = int(parts[0])
-            if re.search(r'FROM|TO|COST|DEMAND|EDGE|ReE.|ReA.|ARC', line, re.IGNORECASE):
-                continue
-            try:
-                tokens = re.split(r'\s+', line)
-                values = [float(tok) if '.' in tok else int(tok) for tok in tokens]
-                if len(values) >= 4:
-                    u, v, cost, demand = values[:4]
-                    services.append(Service(sid, int(u), int(v), int(demand), int(cost)))
-                    sid += 1
-                    edges.append((int(u), int(v), int(cost)))
-            except ValueError:
-                print(f"⚠️ Linha ignorada (não numérica): {line}")
-                continue
-
-    return services, capacity, edges
-
-def floyd_warshall(graph, travel_segments):
-    nodes = list(graph.vertices)
-    n = len(nodes)
-    index = {node: i for i, node in enumerate(nodes)}
-    dist = [[float('inf')] * n for _ in range(n)]
-    pred = [[None] * n for _ in range(n)]
-    for i in range(n):
-        dist[i][i] = 0
-    for u, v, cost in travel_segments:
-        if u in index and v in index:
-            i_u, i_v = index[u], index[v]
-            if cost < dist[i_u][i_v]:
-                dist[i_u][i_v] = cost
-                pred[i_u][i_v] = i_u
-    for k in range(n):
-        for i in range(n):
-            for j in range(n):
-                if dist[i][k] + dist[k][j] < dist[i][j]:
-                    dist[i][j] = dist[i][k] + dist[k][j]
-                    pred[i][j] = pred[k][j]
-    return dist, pred, index
-
-def clarke_wright(graph, services, capacity, dist, idx):
-    depot = graph.depot
+                parent[rj] = ri
+                head[ri], tail[ri], start[ri], end[ri] = new
+                demand[ri] += demand[rj]
+                label[ri] = next_label
+                next_label += 1
+                routes_left -= 1
+
+    trace.count('savings_scanned', scanned)
+    trace.count('merges', n - routes_left)
+
+    # Mesma ordem de saída da versão com lista de rotas: conjunto de rótulos
+    # montado na ordem dos serviços
+    roots = {label[find(p)]: find(p) for p in range(n)}
     routes = []
-    route_id_map = {}
-    for s in services:
-        route = {'ids': [s.id], 'demand': s.demand, 'start': s.u, 'end': s.v}
-        route_id_map[s.id] = len(routes)
+    for lab in set(label[find(p)] for p in range(n)):
+        route = []
+        prev, cur = -1, head[roots[lab]]
+        while cur >= 0:
+            route.append(2 * cur)
+            prev, cur = cur, (link_a[cur] if link_a[cur] != prev else link_b[cur])
         routes.append(route)
-    savings = []
-    for i in services:
-        for j in services:
-            if i.id >= j.id:
-                continue
-            d0i = dist[idx[depot]][idx[i.u]]
-            d0j = dist[idx[depot]][idx[j.u]]
-            dij = dist[idx[i.u]][idx[j.u]]
-            s_val = d0i + d0j - dij
-            savings.append((s_val, i.id, j.id))
-    savings.sort(reverse=True)
-    for _, i_id, j_id in savings:
-        if i_id not in route_id_map or j_id not in route_id_map:
-            continue
-        ri = routes[route_id_map[i_id]]
-        rj = routes[route_id_map[j_id]]
-        if ri is rj:
-            continue
-        can_merge = False
-        if ri['end'] == rj['start']:
-            new_ids = ri['ids'] + rj['ids']
-            new_start, new_end = ri['start'], rj['end']
-            can_merge = True
-        elif rj['end'] == ri['start']:
-            new_ids = rj['ids'] + ri['ids']
-            new_start, new_end = rj['start'], ri['end']
-            can_merge = True
-        elif ri['end'] == rj['end']:
-            new_ids = ri['ids'] + rj['ids'][::-1]
-            new_start, new_end = ri['start'], rj['start']
-            can_merge = True
-        elif ri['start'] == rj['start']:
-            new_ids = ri['ids'][::-1] + rj['ids']
-            new_start, new_end = ri['end'], rj['end']
-            can_merge = True
-        if can_merge and ri['demand'] + rj['demand'] <= capacity:
-            new_route = {
-                'ids': new_ids,
-                'demand': ri['demand'] + rj['demand'],
-                'start': new_start,
-                'end': new_end
-            }
-            new_index = len(routes)
-            routes.append(new_route)
-            for sid in ri['ids'] + rj['ids']:
-                route_id_map[sid] = new_index
-    unique_indices = set(route_id_map.values())
-    return [routes[i]['ids'] for i in unique_indices]
-
-def format_solution(routes, start_clock, end_clock, dist, idx, services_map, graph):
-    depot = graph.depot
-    lines = []
+    return routes
+
+def giant_tour(ctx):
+    # Todos os serviços numa única sequência, pelo vizinho mais próximo: sai
+    # do depósito e vai sempre à orientação de serviço ainda não visitado
+    # mais perto do fim da anterior (empates: menor orientação)
+    n = ctx.n_services
+    taken = np.zeros(2 * n, dtype=np.int64)   # INF nas orientações já usadas ou proibidas
+    taken[1::2][~ctx.flippable] = INF          # Arcos e nós só no sentido original
+    tour = []
+    row = ctx.from_depot
+    for _ in range(n):
+        t = int(np.argmin(row + taken))
+        tour.append(t)
+        taken[2 * (t >> 1):2 * (t >> 1) + 2] = INF
+        row = ctx.deadhead[t]
+    return tour
+
+def split(tour, ctx):
+    # Divisão ótima da sequência em viagens que respeitam a capacidade
+    # (Ulusoy/Prins): caminho mínimo num grafo acíclico em que o arco i -> j
+    # é a viagem com tour[i:j]. Com somas prefixas, o custo da viagem é
+    # a[i] + b[j], e como as cargas são não negativas as origens viáveis de
+    # j formam uma janela [lo, j) que só avança; o mínimo de V[i] + a[i] na
+    # janela vem de uma fila monotônica, então a divisão é O(S).
+    n = len(tour)
+    if n == 0:
+        return []
+    t = np.asarray(tour, dtype=np.int64)
+    inner = np.zeros(n, dtype=np.int64)                 # Deslocamentos de tour[0] até tour[k]
+    np.cumsum(ctx.deadhead[t[:-1], t[1:]], out=inner[1:])
+    served = np.zeros(n + 1, dtype=np.int64)            # Custos de serviço de tour[:k]
+    np.cumsum(ctx.cost[t >> 1], out=served[1:])
+    loads = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(ctx.demand[t >> 1], out=loads[1:])
+    a = (ctx.from_depot[t] - inner - served[:-1]).tolist()
+    b = [0] + (inner + served[1:] + ctx.to_depot[t]).tolist()
+    loads = loads.tolist()
+
+    value = [0] + [None] * n
+    cut = [0] * (n + 1)
+    window = deque()                                    # Origens i com V[i] + a[i] crescente
+    lo = 0
+    for j in range(1, n + 1):
+        i = j - 1
+        key = value[i] + a[i]
+        while window and value[window[-1]] + a[window[-1]] >= key:
+            window.pop()
+        window.append(i)
+        while loads[j] - loads[lo] > ctx.capacity:
+            lo += 1
+        while window and window[0] < lo:
+            window.popleft()
+        if not window:
+            raise ValueError(f"Serviço {ctx.service_id(tour[j - 1])} excede a capacidade do veículo")
+        best = window[0]
+        value[j] = value[best] + a[best] + b[j]
+        cut[j] = best
+
+    routes = []
+    j = n
+    while j > 0:
+        routes.append(tour[cut[j]:j])
+        j = cut[j]
+    routes.reverse()
+    return routes
+
+def route_first(ctx):
+    # Construção alternativa a clarke_wright: sequência gigante pelo vizinho
+    # mais próximo, dividida depois em viagens de forma ótima
+    trace = perfil.current()
+    with trace.phase('giant_tour'):
+        tour = giant_tour(ctx)
+    with trace.phase('split'):
+        routes = split(tour, ctx)
+    trace.count('split_trips', len(routes))
+    return routes
+
+# Construções disponíveis para etapa3.solve_with_improvement
+CONSTRUCTORS = {
+    'clarke_wright': clarke_wright,
+    'split': route_first,
+}
+
+def format_solution(routes, start_clock, end_clock, ctx):
+    with perfil.current().phase('format'):
+        return _format_solution(routes, start_clock, end_clock, ctx)
+
+def _format_solution(routes, start_clock, end_clock, ctx):
+    # Cabeçalho: custo total, nº de rotas e as marcas de time.process_time()
+    # do início da resolução (antes da leitura) e de quando a solução ficou
+    # pronta
+    labels = ctx.labels.tolist()
+    depot = ctx.depot
     total_cost = 0
     formatted_routes = []
-    for ids in routes:
-        load = sum(services_map[i].demand for i in ids)
-        segs = []
+    for route in routes:
+        load = sum(ctx.demand_list[t >> 1] for t in route)
+        route_cost = 0
+        segs = [f"(D 0,{labels[depot]},{labels[depot]})"]
         current = depot
-        segs.append((0, 'D', 0, depot, depot))
-        for sid in ids:
-            svc = services_map[sid]
-            if current != svc.u:
-                d = dist[idx[current]][idx[svc.u]]
-                total_cost += d
-                segs.append((d, 'D', 0, current, svc.u))
-            total_cost += svc.cost
-            segs.append((0, 'S', sid, svc.u, svc.v))
-            current = svc.v
+        prev = None
+        for t in route:
+            u, v = int(ctx.start_node[t]), int(ctx.end_node[t])
+            if current != u:
+                d = int(ctx.from_depot[t] if prev is None else ctx.deadhead[prev, t])
+                route_cost += d
+                segs.append(f"(D 0,{labels[current]},{labels[u]})")
+            route_cost += ctx.cost_list[t >> 1]
+            segs.append(f"(S {ctx.service_id(t)},{labels[u]},{labels[v]})")
+            current, prev = v, t
         if current != depot:
-            d_back = dist[idx[current]][idx[depot]]
-            total_cost += d_back
-            segs.append((d_back, 'D', 0, current, depot))
-        formatted_routes.append((load, segs))
+            route_cost += int(ctx.to_depot[prev])
+            segs.append(f"(D 0,{labels[current]},{labels[depot]})")
+        total_cost += route_cost
+        formatted_routes.append((load, route_cost, segs))
     out = [str(total_cost), str(len(formatted_routes)), str(start_clock), str(end_clock), '']
-    for idx_r, (load, segs) in enumerate(formatted_routes, start=1):
-        visits = len(segs)
-        route_cost = sum(
-            (d if t == 'D' else 0) + (services_map[s].cost if t == 'S' else 0)
-            for d, t, s, _, _ in segs
-        )
-        trip = ' '.join(
-            f"({'D' if t == 'D' else 'S'} {s},{u},{v})"
-            for d, t, s, u, v in segs
-        )
-        out.append(f"0 1 {idx_r} {load} {route_cost} {visits} {trip}")
+    for idx_r, (load, route_cost, segs) in enumerate(formatted_routes, start=1):
+        out.append(f"0 1 {idx_r} {load} {route_cost} {len(segs)} {' '.join(segs)}")
     return '\n'.join(out)
 
-def solve(instance_path):
-    graph = read_graph(instance_path)
-    services, capacity, travel_segments = parse_dat_file(instance_path)
-    dist, pred, idx = floyd_warshall(graph, travel_segments)
-    services_map = {s.id: s for s in services}
-    start_clock = time.process_time()
-    routes = clarke_wright(graph, services, capacity, dist, idx)
-    end_clock = time.process_time()
-    return format_solution(routes, start_clock, end_clock, dist, idx, services_map, graph)
+def load_context(instance_path, lazy=False):
+    # Instância lida e matrizes de caminhos mínimos, reaproveitadas do cache
+    # em disco enquanto o arquivo .dat não mudar; o contexto de roteamento é
+    # montado a partir delas. Com lazy, as distâncias vêm de um
+    # DistanceOracle (sem matriz n x n nem cache em disco).
+    trace = perfil.current()
+    with trace.phase('parse'):
+        instance = instancia.load_instance(instance_path)
+    with trace.phase('apsp'):
+        if lazy:
+            dist = distance_oracle(instance)
+            dist.precompute([instance.depot] + [x for s in instance.services() for x in s[2:4]])
+        else:
+            dist, pred, idx = cache.cached_shortest_paths(
+                instance_path, 'custos', lambda: shortest_paths(instance))
+    with trace.phase('context'):
+        return RoutingContext(instance, dist)
+
+def solve_with(instance_path, build, timings=None, trace=None):
+    # Roteiro comum aos resolvedores chamados pelo lote: build(ctx) devolve as
+    # rotas e roda com o rastro ativo. timings (opcional) recebe a duração de
+    # cada fase em segundos; trace (perfil.Trace, opcional) recebe o rastro
+    # completo com os contadores. Os resolvedores que aceitam workers usam 1
+    # por padrão, já que o lote ocupa os núcleos com instâncias diferentes
+    trace = trace or perfil.Trace(os.path.basename(instance_path))
+    with perfil.activate(trace):
+        start_clock = trace.mark('start')
+        ctx = load_context(instance_path)
+        routes = build(ctx)
+        end_clock = trace.mark('solution')
+        solution = format_solution(routes, start_clock, end_clock, ctx)
+    if timings is not None:
+        timings.update(trace.timers)
+    return solution
+
+def solve(instance_path, timings=None, trace=None):
+    # Clarke & Wright constrói sempre no sentido original dos serviços; o
+    # sentido das arestas obrigatórias é escolhido depois, rota a rota
+    return solve_with(instance_path, lambda ctx: orient_routes(clarke_wright(ctx), ctx)[0], timings, trace)
 
 def main():
-    os.makedirs(OUTPUT_DIR, exist_ok=True)
-    for filename in os.listdir(INPUT_DIR):
-        if not filename.lower().endswith('.dat'):
-            continue
-        instance_path = os.path.join(INPUT_DIR, filename)
-        output_name = f"sol_{os.path.splitext(filename)[0]}.dat"
-        output_path = os.path.join(OUTPUT_DIR, output_name)
-        try:
-            print(f"\n🧪 Processando: {filename}")
-            solution = solve(instance_path)
-            with open(output_path, "w") as f:
-                f.write(solution)
-            print(f"✅ Custo salvo em {output_name}")
-        except Exception as e:
-            print(f"❌ Erro ao processar {filename}: {e}")
-
-    print("\n✅ Todos os testes concluídos.")
+    # Processa todas as instâncias em paralelo (ver lote.py para as opções)
+    import lote
+    lote.main(solver='etapa2')
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
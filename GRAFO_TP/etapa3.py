@@ -1,37 +1,46 @@
-
-import time
-from grafo import read_graph
-from GRAFO_TP.etapa2 import parse_services, floyd_warshall, clarke_wright, format_solution
-from melhoria import two_opt, relocate
-
-def solve_with_improvement(instance_path):
-    graph = read_graph(instance_path)
-    with open(instance_path) as f:
-        for line in f:
-            if line.startswith('Depot Node:'):
-                graph.depot = line.split()[-1]
-                break
-    graph.required_vertices.discard(graph.depot)
-
-    services, capacity, travel_segments = parse_services(instance_path)
-    dist, pred, idx = floyd_warshall(graph, travel_segments)
-    services_map = {s.id: s for s in services}
-
-    # Solução inicial (Clarke & Wright)
-    routes = clarke_wright(graph, services, capacity, dist, idx)
-
-    # Aplicação de melhorias
-    # 1. 2-opt dentro de cada rota
-    for i in range(len(routes)):
-        improved_route, _ = two_opt(routes[i], services_map, dist, idx, graph.depot)
-        routes[i] = improved_route
-
-    # 2. Realocação entre rotas
-    routes = relocate(routes, services_map, capacity, dist, idx, graph.depot)
-
-    start_clock = time.process_time()
-    end_clock = time.process_time()  # Só marca o tempo das melhorias aqui
-    return format_solution(routes, start_clock, end_clock, dist, idx, services_map, graph)
+import os
+
+import perfil
+from etapa2 import CONSTRUCTORS, load_context, format_solution
+from melhoria import granular_neighbors, orient_routes, two_opt, relocate
+
+def solve_with_improvement(instance_path, timings=None, trace=None, constructor='clarke_wright', granular=None):
+    # timings (opcional) recebe a duração de cada fase em segundos; trace
+    # (perfil.Trace, opcional) recebe o rastro completo com os contadores;
+    # constructor escolhe a solução inicial (ver etapa2.CONSTRUCTORS) e
+    # granular (k) restringe as melhorias aos k serviços mais próximos
+    if constructor not in CONSTRUCTORS:
+        raise ValueError(f"Construção desconhecida: {constructor}")
+    trace = trace or perfil.Trace(os.path.basename(instance_path))
+    with perfil.activate(trace):
+        start_clock = trace.mark('start')
+        # Instância e distâncias vêm do cache em disco (ver etapa2.load_context)
+        ctx = load_context(instance_path)
+
+        # Solução inicial (Clarke & Wright ou sequência gigante + divisão), já
+        # com o melhor sentido de cada aresta obrigatória
+        routes, _ = orient_routes(CONSTRUCTORS[constructor](ctx), ctx)
+        neighbors = granular_neighbors(ctx, granular) if granular else None
+
+        # Aplicação de melhorias
+        # 1. 2-opt dentro de cada rota
+        for i in range(len(routes)):
+            improved_route, _ = two_opt(routes[i], ctx, neighbors)
+            routes[i] = improved_route
+
+        # 2. Realocação entre rotas
+        routes = relocate(routes, ctx, neighbors)
+
+        # 3. Melhor sentido das arestas obrigatórias de cada rota
+        routes, _ = orient_routes(routes, ctx)
+        end_clock = trace.mark('solution')
+        solution = format_solution(routes, start_clock, end_clock, ctx)
+    if timings is not None:
+        timings.update(trace.timers)
+    return solution
+
+def solve_with_split(instance_path, timings=None, trace=None):
+    return solve_with_improvement(instance_path, timings, trace, constructor='split')
 
 def main():
     instance_path = "BHW1.dat"
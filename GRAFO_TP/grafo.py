@@ -1,89 +1,144 @@
+import numpy as np
+
+from caminhos import build_csr
+from instancia import load_instance
+
+
 class Graph:
-    def __init__(self):
-        self.vertices = set()               # Armazena os vértices (nós) do grafo.
-        self.edges = []                     # Lista de arestas bidirecionais (tuplas).
-        self.arcs = []                      # Lista de arcos unidirecionais (tuplas).
-        self.required_vertices = set()      # Vértices que exigem serviços.
-        self.required_edges = []            # Arestas que exigem serviços.
-        self.required_arcs = []             # Arcos que exigem serviços.
+    # Representação compacta: vértices com ids densos 0..n-1 (labels[id] é o
+    # rótulo original do arquivo) e ligações em arrays NumPy, com as
+    # obrigatórias primeiro. A adjacência CSR de saída (out_*) e de entrada
+    # (in_*) percorre arestas nos dois sentidos e arcos só no seu, com o
+    # custo de travessia como peso. Os atributos antigos em listas e
+    # conjuntos de rótulos (vertices, edges, ...) continuam disponíveis como
+    # propriedades, montadas a cada acesso.
+    __slots__ = (
+        'labels', 'depot_id', 'required_nodes', 'n_required_edges', 'n_required_arcs',
+        'edge_tails', 'edge_heads', 'edge_weights', 'arc_tails', 'arc_heads', 'arc_weights',
+        'out_offsets', 'out_targets', 'out_weights', 'in_offsets', 'in_targets', 'in_weights',
+        'source',
+    )
+
+    def __init__(self, labels, edge_tails, edge_heads, edge_weights, arc_tails, arc_heads, arc_weights,
+                 required_nodes=(), n_required_edges=0, n_required_arcs=0, depot_id=None):
+        self.labels = np.asarray(labels)
+        self.depot_id = depot_id
+        self.required_nodes = np.asarray(required_nodes, dtype=np.int32)
+        self.n_required_edges = n_required_edges
+        self.n_required_arcs = n_required_arcs
+        self.edge_tails = np.asarray(edge_tails, dtype=np.int32)
+        self.edge_heads = np.asarray(edge_heads, dtype=np.int32)
+        self.edge_weights = np.asarray(edge_weights, dtype=np.int32)
+        self.arc_tails = np.asarray(arc_tails, dtype=np.int32)
+        self.arc_heads = np.asarray(arc_heads, dtype=np.int32)
+        self.arc_weights = np.asarray(arc_weights, dtype=np.int32)
+        self.source = None
+
+        n = len(self.labels)
+        tails = np.concatenate([self.edge_tails, self.edge_heads, self.arc_tails])
+        heads = np.concatenate([self.edge_heads, self.edge_tails, self.arc_heads])
+        weights = np.concatenate([self.edge_weights, self.edge_weights, self.arc_weights])
+        self.out_offsets, self.out_targets, self.out_weights = _csr32(n, tails, heads, weights)
+        self.in_offsets, self.in_targets, self.in_weights = _csr32(n, heads, tails, weights)
+
+    @property
+    def n_nodes(self):
+        return len(self.labels)
+
+    def index(self):
+        # Rótulo -> id denso
+        return {label: i for i, label in enumerate(self.labels.tolist())}
+
+    def _pairs(self, tails, heads):
+        labels = self.labels.tolist()
+        return [(labels[u], labels[v]) for u, v in zip(tails.tolist(), heads.tolist())]
+
+    # Adaptador para o formato antigo (rótulos em listas e conjuntos)
+    @property
+    def vertices(self):
+        return set(self.labels.tolist())
+
+    @property
+    def edges(self):
+        return self._pairs(self.edge_tails, self.edge_heads)
+
+    @property
+    def arcs(self):
+        return self._pairs(self.arc_tails, self.arc_heads)
+
+    @property
+    def required_vertices(self):
+        return set(self.labels[self.required_nodes].tolist())
+
+    @property
+    def required_edges(self):
+        k = self.n_required_edges
+        return self._pairs(self.edge_tails[:k], self.edge_heads[:k])
+
+    @property
+    def required_arcs(self):
+        k = self.n_required_arcs
+        return self._pairs(self.arc_tails[:k], self.arc_heads[:k])
+
+    @property
+    def edge_costs(self):
+        return self.edge_weights.tolist()
+
+    @property
+    def arc_costs(self):
+        return self.arc_weights.tolist()
+
+    @property
+    def depot(self):
+        return None if self.depot_id is None else self.labels[self.depot_id].item()
+
+
+def _csr32(n, tails, heads, weights):
+    # Ids e custos cabem em 32 bits em todas as instâncias
+    return tuple(a.astype(np.int32) for a in build_csr(n, tails, heads, weights))
+
+
+def graph_from_instance(instance):
+    def links(required, optional):
+        return (np.concatenate([required.tails, optional.tails]),
+                np.concatenate([required.heads, optional.heads]),
+                np.concatenate([required.costs, optional.costs]))
+
+    edge_tails, edge_heads, edge_weights = links(instance.required_edges, instance.edges)
+    arc_tails, arc_heads, arc_weights = links(instance.required_arcs, instance.arcs)
+    return Graph(instance.labels, edge_tails, edge_heads, edge_weights, arc_tails, arc_heads, arc_weights,
+                 required_nodes=np.unique(instance.required_nodes.tails),
+                 n_required_edges=len(instance.required_edges.tails),
+                 n_required_arcs=len(instance.required_arcs.tails),
+                 depot_id=instance.depot)
+
+
+def as_compact(graph):
+    # Aceita também objetos no formato antigo (vertices, edges, arcs, ... com
+    # rótulos), convertendo-os para a representação compacta
+    if isinstance(graph, Graph):
+        return graph
+    labels = list(graph.vertices)
+    index = {label: i for i, label in enumerate(labels)}
+
+    def ends(pairs):
+        return [index[u] for u, _ in pairs], [index[v] for _, v in pairs]
+
+    edges, arcs = list(graph.edges), list(graph.arcs)
+    edge_costs = getattr(graph, 'edge_costs', None) or [1] * len(edges)
+    arc_costs = getattr(graph, 'arc_costs', None) or [1] * len(arcs)
+    depot = getattr(graph, 'depot', None)
+    compact = Graph(labels, *ends(edges), edge_costs, *ends(arcs), arc_costs,
+                    required_nodes=sorted(index[v] for v in getattr(graph, 'required_vertices', ())),
+                    n_required_edges=len(getattr(graph, 'required_edges', ())),
+                    n_required_arcs=len(getattr(graph, 'required_arcs', ())),
+                    depot_id=index.get(depot))
+    compact.source = getattr(graph, 'source', None)
+    return compact
 
 
 def read_graph(filename):
-    graph = Graph()
-    current_section = None
-    skip_header = False  # Controla se a próxima linha deve ser ignorada (cabeçalho)
-    
-    with open(filename, 'r') as f:
-        for line in f:
-            line = line.strip()
-            if not line or line.startswith('#') or line.startswith('the'):
-                continue
-            
-            # Identificar seções e pular cabeçalhos
-            if line.startswith('ReN.'):
-                current_section = 'required_nodes'
-                skip_header = True  # A próxima linha é o cabeçalho "DEMAND S. COST"
-                continue
-            elif line.startswith('ReE.'):
-                current_section = 'required_edges'
-                skip_header = True  # A próxima linha é o cabeçalho
-                continue
-            elif line.startswith('ReA.'):
-                current_section = 'required_arcs'
-                skip_header = True  # A próxima linha é o cabeçalho
-                continue
-            elif line.startswith('EDGE'):
-                current_section = 'edges'
-                skip_header = True  # A próxima linha é o cabeçalho
-                continue
-            elif line.startswith('ARC'):
-                current_section = 'arcs'
-                skip_header = True  # A próxima linha é o cabeçalho
-                continue
-            
-            # Pular linha de cabeçalho após identificar a seção
-            if skip_header:
-                skip_header = False
-                continue
-            
-            parts = line.split('\t')  # Divide por tabulação (ajuste crítico)
-            
-            # Processar metadados
-            if line.startswith('Depot Node:'):
-                depot = parts[1].strip()
-                graph.depot = depot
-                graph.vertices.add(depot)
-            
-            # Processar seções
-            elif current_section == 'required_nodes':
-                node_id = parts[0].strip().lstrip('N')  # Remove o 'N' (ex: 'N4' → '4')
-                graph.required_vertices.add(node_id)
-                graph.vertices.add(node_id)
-                
-            elif current_section == 'required_edges':
-                from_node = parts[1].strip()
-                to_node = parts[2].strip()
-                graph.required_edges.append((from_node, to_node))
-                graph.edges.append((from_node, to_node))  # Assume bidirecional
-                graph.vertices.update([from_node, to_node])
-                
-            elif current_section == 'required_arcs':
-                from_node = parts[1].strip()
-                to_node = parts[2].strip()
-                graph.required_arcs.append((from_node, to_node))
-                graph.arcs.append((from_node, to_node))  # Unidirecional
-                graph.vertices.update([from_node, to_node])
-                
-            elif current_section == 'edges':
-                from_node = parts[1].strip()
-                to_node = parts[2].strip()
-                graph.edges.append((from_node, to_node))
-                graph.vertices.update([from_node, to_node])
-                
-            elif current_section == 'arcs':
-                from_node = parts[1].strip()
-                to_node = parts[2].strip()
-                graph.arcs.append((from_node, to_node))
-                graph.vertices.update([from_node, to_node])
-
-    return graph
\ No newline at end of file
+    # A leitura é reaproveitada do cache em disco enquanto o arquivo não mudar
+    graph = graph_from_instance(load_instance(filename))
+    graph.source = filename  # Permite às estatísticas usarem o cache também
+    return graph
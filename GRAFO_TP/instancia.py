@@ -0,0 +1,154 @@
+from array import array
+
+import numpy as np
+
+import cache
+
+# Seções do arquivo .dat e quantas colunas numéricas cada linha de dados tem
+# (sem contar o nome, como "E1" ou "NrA3").
+SECTIONS = {
+    'ReN.': ('required_nodes', 2),   # DEMAND, S. COST
+    'ReE.': ('required_edges', 5),   # FROM, TO, T. COST, DEMAND, S. COST
+    'ReA.': ('required_arcs', 5),
+    'EDGE': ('edges', 3),            # FROM, TO, T. COST
+    'ARC': ('arcs', 3),
+}
+
+
+class Section:
+    # Colunas de uma seção guardadas como arrays (um por campo). Os vértices já
+    # estão em ids densos, começando em 0.
+    def __init__(self):
+        self.names = []
+        self.tails = np.zeros(0, dtype=np.int32)
+        self.heads = np.zeros(0, dtype=np.int32)
+        self.costs = np.zeros(0, dtype=np.int64)         # Custo de travessia
+        self.demands = np.zeros(0, dtype=np.int64)
+        self.service_costs = np.zeros(0, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.names)
+
+
+class Instance:
+    def __init__(self):
+        self.name = None
+        self.capacity = None
+        self.depot = None          # Id denso do depósito
+        self.labels = None         # Id denso -> rótulo original do vértice
+        self.required_nodes = Section()
+        self.required_edges = Section()
+        self.required_arcs = Section()
+        self.edges = Section()
+        self.arcs = Section()
+
+    @property
+    def n_nodes(self):
+        return len(self.labels)
+
+    def label(self, node):
+        return int(self.labels[node])
+
+    def node_index(self):
+        return {int(label): i for i, label in enumerate(self.labels)}
+
+    def services(self):
+        # Serviços na ordem do arquivo (ReN, ReE, ReA), numerados a partir de 1:
+        # (id, tipo, origem, destino, demanda, custo de serviço)
+        sid = 1
+        for kind, section in (('N', self.required_nodes), ('E', self.required_edges), ('A', self.required_arcs)):
+            for u, v, demand, cost in zip(section.tails.tolist(), section.heads.tolist(),
+                                          section.demands.tolist(), section.service_costs.tolist()):
+                yield sid, kind, u, v, demand, cost
+                sid += 1
+
+    def travel_arcs(self):
+        # Ligações percorríveis (tails, heads, custos): arestas nos dois sentidos
+        edge_tails = np.concatenate([self.required_edges.tails, self.edges.tails])
+        edge_heads = np.concatenate([self.required_edges.heads, self.edges.heads])
+        edge_costs = np.concatenate([self.required_edges.costs, self.edges.costs])
+        tails = np.concatenate([edge_tails, edge_heads, self.required_arcs.tails, self.arcs.tails])
+        heads = np.concatenate([edge_heads, edge_tails, self.required_arcs.heads, self.arcs.heads])
+        costs = np.concatenate([edge_costs, edge_costs, self.required_arcs.costs, self.arcs.costs])
+        return tails, heads, costs
+
+
+def parse_instance(filename):
+    # Leitura em uma única passada: cada linha é dividida uma vez por espaços
+    # em branco e o primeiro token decide se é cabeçalho, seção ou dado.
+    instance = Instance()
+    header = {}
+    columns = {key: [[], array('q'), array('q'), array('q'), array('q'), array('q')]
+               for key, _ in SECTIONS.values()}
+    current = None
+    width = 0
+
+    with open(filename, 'r') as f:
+        for line in f:
+            tokens = line.split()
+            if not tokens:
+                continue
+            first = tokens[0]
+            if first in SECTIONS:
+                current, width = SECTIONS[first]
+                continue
+            if first.endswith(':') or first in ('#Required', 'Optimal', 'Depot'):
+                key = line.split(':', 1)[0].strip()
+                header[key] = tokens[-1]
+                continue
+            if current is None or len(tokens) != width + 1:
+                continue  # Rodapé ("the data is based on ...") e linhas soltas
+            try:
+                values = [int(tok) for tok in tokens[1:]]
+            except ValueError:
+                continue
+            cols = columns[current]
+            cols[0].append(first)
+            if width == 2:
+                node = int(first.lstrip('N'))
+                cols[1].append(node)
+                cols[2].append(node)
+                cols[3].append(0)
+                cols[4].append(values[0])
+                cols[5].append(values[1])
+            else:
+                cols[1].append(values[0])
+                cols[2].append(values[1])
+                cols[3].append(values[2])
+                if width == 5:
+                    cols[4].append(values[3])
+                    cols[5].append(values[4])
+
+    instance.name = header.get('Name')
+    instance.capacity = int(header['Capacity']) if 'Capacity' in header else None
+    depot = int(header['Depot Node']) if 'Depot Node' in header else None
+
+    # Ids densos: os vértices das instâncias são numerados 1..#Nodes, então o id
+    # é o rótulo - 1; rótulos fora da faixa aumentam o total de vértices.
+    n = int(header.get('#Nodes', 0))
+    for cols in columns.values():
+        if len(cols[1]):
+            n = max(n, max(cols[1]), max(cols[2]))
+    if depot is not None:
+        n = max(n, depot)
+    instance.labels = np.arange(1, n + 1, dtype=np.int32)
+    instance.depot = depot - 1 if depot is not None else None
+
+    for key, cols in columns.items():
+        section = getattr(instance, key)
+        section.names = cols[0]
+        section.tails = np.frombuffer(cols[1], dtype=np.int64).astype(np.int32) - 1
+        section.heads = np.frombuffer(cols[2], dtype=np.int64).astype(np.int32) - 1
+        section.costs = np.frombuffer(cols[3], dtype=np.int64).copy()
+        if len(cols[4]):
+            section.demands = np.frombuffer(cols[4], dtype=np.int64).copy()
+            section.service_costs = np.frombuffer(cols[5], dtype=np.int64).copy()
+        else:
+            section.demands = np.zeros(len(cols[0]), dtype=np.int64)
+            section.service_costs = np.zeros(len(cols[0]), dtype=np.int64)
+    return instance
+
+
+def load_instance(filename):
+    # Versão com cache em disco (ver cache.py)
+    return cache.cached_object(filename, 'instancia', lambda: parse_instance(filename))
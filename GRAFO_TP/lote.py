@@ -0,0 +1,221 @@
+import argparse
+import json
+import multiprocessing
+import os
+import time
+from multiprocessing.connection import wait
+
+import perfil
+from cache import atomic_write
+from verificador import verify_solution
+
+INPUT_DIR = 'instancias'
+OUTPUT_DIR = 'solucoes'
+MANIFEST_NAME = 'manifest.json'
+
+# Resolvedores disponíveis: nome -> (módulo, função). A função recebe o caminho
+# da instância e um perfil.Trace e devolve a solução formatada.
+SOLVERS = {
+    'etapa2': ('etapa2', 'solve'),
+    'etapa3': ('etapa3', 'solve_with_improvement'),
+    'etapa3_split': ('etapa3', 'solve_with_split'),
+    'busca': ('busca', 'solve'),
+    'decomposicao': ('decomposicao', 'solve'),
+}
+
+
+def output_path_for(instance_path, output_dir=OUTPUT_DIR):
+    name = os.path.splitext(os.path.basename(instance_path))[0]
+    return os.path.join(output_dir, f"sol_{name}.dat")
+
+
+def load_manifest(manifest_path):
+    # Manifesto de uma execução anterior (None se não existir ou estiver ilegível)
+    try:
+        with open(manifest_path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def previous_results(manifest, solver):
+    # Instância -> resultado da execução anterior, só se ela usou o mesmo
+    # resolvedor
+    if not manifest or manifest.get('solver') != solver:
+        return {}
+    return {entry['instance']: entry for entry in manifest.get('instances', [])}
+
+
+def is_up_to_date(instance_path, output_path, previous):
+    # A solução só é reaproveitada se a execução anterior, com o mesmo
+    # resolvedor, terminou bem e o arquivo é mais novo que a instância
+    entry = previous.get(os.path.basename(instance_path))
+    return (entry is not None and entry.get('status') == 'ok'
+            and entry.get('solution') == os.path.basename(output_path)
+            and os.path.exists(output_path)
+            and os.path.getmtime(output_path) >= os.path.getmtime(instance_path))
+
+
+def trace_path_for(instance_path, trace_dir):
+    name = os.path.splitext(os.path.basename(instance_path))[0]
+    return os.path.join(trace_dir, f"trace_{name}.json")
+
+
+def _solve_one(solver, instance_path, output_path, conn, trace_dir=None, profile=False, verify=False):
+    # Executado no processo filho: resolve, confere (com verify), grava a
+    # solução de forma atômica e devolve o resumo pelo pipe
+    try:
+        module_name, function_name = SOLVERS[solver]
+        solve = getattr(__import__(module_name), function_name)
+        trace = perfil.Trace(os.path.basename(instance_path), profile=profile and bool(trace_dir))
+        start = time.perf_counter()
+        solution = solve(instance_path, trace=trace)
+        if trace_dir:
+            trace.write(trace_path_for(instance_path, trace_dir))
+        if verify:
+            # Solução inválida não é gravada (e a de uma execução anterior
+            # sai), para que não pareça pronta a quem lê o diretório
+            errors = verify_solution(solution, instance_path)
+            if errors:
+                if os.path.exists(output_path):
+                    os.remove(output_path)
+                conn.send({'status': 'invalid', 'reason': '; '.join(errors[:5])})
+                return
+        atomic_write(output_path, lambda f: f.write(solution.encode()))
+        lines = solution.splitlines()
+        conn.send({
+            'status': 'ok',
+            'cost': int(float(lines[0])),
+            'routes': int(lines[1]),
+            'seconds': time.perf_counter() - start,
+            'timings': trace.timers,
+            'counters': trace.counters,
+        })
+    except Exception as e:
+        conn.send({'status': 'error', 'reason': f"{type(e).__name__}: {e}"})
+    finally:
+        conn.close()
+
+
+def run_batch(instance_paths, output_dir=OUTPUT_DIR, solver='etapa2', workers=None,
+              timeout=None, resume=False, manifest_path=None, verbose=True, trace_dir=None, profile=False,
+              verify=False):
+    os.makedirs(output_dir, exist_ok=True)
+    if trace_dir:
+        os.makedirs(trace_dir, exist_ok=True)
+    workers = workers or os.cpu_count() or 1
+    manifest_path = manifest_path or os.path.join(output_dir, MANIFEST_NAME)
+    results = {}
+
+    # Com resume, o manifesto anterior decide o que pode ser pulado; o
+    # resultado (custo, rotas, tempos) é copiado para o novo manifesto
+    previous = previous_results(load_manifest(manifest_path), solver) if resume else {}
+
+    # Maiores primeiro: as instâncias DI-NEARP começam cedo e não sobram sozinhas
+    # no fim do lote
+    pending = []
+    for path in sorted(instance_paths, key=os.path.getsize, reverse=True):
+        output_path = output_path_for(path, output_dir)
+        if resume and is_up_to_date(path, output_path, previous):
+            entry = previous[os.path.basename(path)]
+            results[path] = dict({k: v for k, v in entry.items() if k not in ('instance', 'solution')},
+                                 resumed=True)
+            continue
+        pending.append((path, output_path))
+    pending.reverse()  # pop() retira do fim
+
+    running = {}  # conn -> (processo, instância, prazo, início)
+    batch_start = time.perf_counter()
+    while pending or running:
+        while pending and len(running) < workers:
+            path, output_path = pending.pop()
+            receiver, sender = multiprocessing.Pipe(duplex=False)
+            process = multiprocessing.Process(
+                target=_solve_one, args=(solver, path, output_path, sender, trace_dir, profile, verify))
+            process.start()
+            sender.close()
+            started = time.perf_counter()
+            deadline = started + timeout if timeout else None
+            running[receiver] = (process, path, deadline, started)
+            if verbose:
+                print(f"🧪 Processando: {os.path.basename(path)}")
+
+        deadlines = [d for _, _, d, _ in running.values() if d is not None]
+        wait_for = max(0.0, min(deadlines) - time.perf_counter()) if deadlines else None
+        for conn in wait(list(running), timeout=wait_for):
+            process, path, _, started = running.pop(conn)
+            try:
+                result = conn.recv()
+            except EOFError:
+                result = {'status': 'error', 'reason': 'processo encerrado sem resposta'}
+            conn.close()
+            process.join()
+            if process.exitcode not in (0, None) and result['status'] == 'ok':
+                result = {'status': 'error', 'reason': f"código de saída {process.exitcode}"}
+            results[path] = result
+            if verbose:
+                name = os.path.basename(path)
+                if result['status'] == 'ok':
+                    print(f"✅ {name}: custo {result['cost']} ({result['seconds']:.2f} s)")
+                else:
+                    print(f"❌ Erro ao processar {name}: {result['reason']}")
+
+        # Estouro de tempo encerra só o processo daquela instância
+        now = time.perf_counter()
+        for conn, (process, path, deadline, started) in list(running.items()):
+            if deadline is not None and now >= deadline:
+                process.terminate()
+                process.join()
+                conn.close()
+                del running[conn]
+                results[path] = {'status': 'timeout', 'seconds': now - started,
+                                 'reason': f"tempo limite de {timeout} s excedido"}
+                if verbose:
+                    print(f"⏱️ Tempo esgotado: {os.path.basename(path)}")
+
+    manifest = {
+        'solver': solver,
+        'workers': workers,
+        'timeout': timeout,
+        'elapsed': time.perf_counter() - batch_start,
+        'instances': [
+            dict({'instance': os.path.basename(path),
+                  'solution': os.path.basename(output_path_for(path, output_dir))}, **results[path])
+            for path in sorted(results)
+        ],
+    }
+    atomic_write(manifest_path, lambda f: f.write(json.dumps(manifest, indent=2).encode()))
+    return manifest
+
+
+def main(solver='etapa2'):
+    parser = argparse.ArgumentParser(description='Resolve em lote as instâncias de instancias/')
+    parser.add_argument('instances', nargs='*', help='Arquivos .dat (padrão: todos de instancias/)')
+    parser.add_argument('--solver', choices=sorted(SOLVERS), default=solver)
+    parser.add_argument('--workers', type=int, default=None, help='Processos em paralelo (padrão: nº de CPUs)')
+    parser.add_argument('--timeout', type=float, default=None, help='Tempo limite por instância, em segundos')
+    parser.add_argument('--resume', action='store_true',
+                        help='Pula instâncias já resolvidas com sucesso pelo mesmo resolvedor (ver o manifesto)')
+    parser.add_argument('--output-dir', default=OUTPUT_DIR)
+    parser.add_argument('--manifest', default=None, help=f'Padrão: <output-dir>/{MANIFEST_NAME}')
+    parser.add_argument('--trace-dir', default=None,
+                        help='Grava o rastro de cada instância (tempos por fase e contadores) em JSON')
+    parser.add_argument('--profile', action='store_true',
+                        help='Com --trace-dir, grava também o cProfile de cada instância (.prof)')
+    parser.add_argument('--verify', action='store_true',
+                        help='Confere cada solução (verificador.py) e marca as inválidas como falha')
+    args = parser.parse_args()
+
+    paths = args.instances or [
+        os.path.join(INPUT_DIR, f) for f in os.listdir(INPUT_DIR) if f.lower().endswith('.dat')
+    ]
+    manifest = run_batch(paths, args.output_dir, args.solver, args.workers, args.timeout,
+                         args.resume, args.manifest, trace_dir=args.trace_dir, profile=args.profile,
+                         verify=args.verify)
+    failed = [r for r in manifest['instances'] if r['status'] in ('error', 'timeout', 'invalid')]
+    print(f"\n✅ Todos os testes concluídos ({len(manifest['instances']) - len(failed)} ok, "
+          f"{len(failed)} com falha) em {manifest['elapsed']:.1f} s.")
+
+
+if __name__ == '__main__':
+    main()
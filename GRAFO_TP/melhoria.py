@@ -1,65 +1,286 @@
 
-import random
-from copy import deepcopy
-
-def calculate_route_cost(route_ids, services_map, dist, idx, depot):
-    total_cost = 0
-    current = depot
-    for sid in route_ids:
-        svc = services_map[sid]
-        if current != svc.u:
-            total_cost += dist[idx[current]][idx[svc.u]]
-        total_cost += svc.cost
-        current = svc.v
-    if current != depot:
-        total_cost += dist[idx[current]][idx[depot]]
-    return total_cost
-
-def two_opt(route_ids, services_map, dist, idx, depot):
-    best = route_ids[:]
-    best_cost = calculate_route_cost(best, services_map, dist, idx, depot)
-    improved = True
-    while improved:
-        improved = False
-        for i in range(1, len(best) - 1):
-            for j in range(i + 1, len(best)):
-                new_route = best[:i] + best[i:j+1][::-1] + best[j+1:]
-                new_cost = calculate_route_cost(new_route, services_map, dist, idx, depot)
-                if new_cost < best_cost:
-                    best = new_route
-                    best_cost = new_cost
-                    improved = True
-                    break
-            if improved:
-                break
-    return best, best_cost
-
-def relocate(routes, services_map, capacity, dist, idx, depot):
-    improved = True
-    while improved:
-        improved = False
-        for i in range(len(routes)):
-            for j in range(len(routes)):
-                if i == j:
-                    continue
-                for sid in routes[i]:
-                    demand = services_map[sid].demand
-                    if sum(services_map[s].demand for s in routes[j]) + demand <= capacity:
-                        new_route_i = routes[i][:]
-                        new_route_j = routes[j][:]
-                        new_route_i.remove(sid)
-                        new_route_j.append(sid)
-                        if not new_route_i:
-                            continue
-                        old_cost = calculate_route_cost(routes[i], services_map, dist, idx, depot) +                                    calculate_route_cost(routes[j], services_map, dist, idx, depot)
-                        new_cost = calculate_route_cost(new_route_i, services_map, dist, idx, depot) +                                    calculate_route_cost(new_route_j, services_map, dist, idx, depot)
-                        if new_cost < old_cost:
-                            routes[i] = new_route_i
-                            routes[j] = new_route_j
-                            improved = True
-                            break
-                if improved:
-                    break
-            if improved:
-                break
-    return routes
+import heapq
+from collections import deque
+
+import numpy as np
+
+import perfil
+
+def calculate_route_cost(route, ctx):
+    # Rota como lista de orientações de serviço (ver contexto.RoutingContext)
+    if not route:
+        return 0
+    t = np.asarray(route, dtype=np.int64)
+    return int(ctx.from_depot[t[0]] + ctx.deadhead[t[:-1], t[1:]].sum()
+               + ctx.cost[t >> 1].sum() + ctx.to_depot[t[-1]])
+
+def orient(route, ctx):
+    with perfil.current().phase('orient'):
+        return _orient(route, ctx)
+
+def _orient(route, ctx):
+    # Melhor sentido de cada aresta obrigatória sem mudar a ordem dos
+    # serviços: caminho mínimo por programação dinâmica com dois estados por
+    # posição (2k ou 2k + 1; arcos e nós repetem o único sentido), em
+    # O(len(route)). Devolve (rota, deslocamento economizado); empates
+    # mantêm a rota como está.
+    m = len(route)
+    if m == 0:
+        return route[:], 0
+    keys = np.asarray(route, dtype=np.int64) >> 1
+    states = np.stack([2 * keys, np.where(ctx.flippable[keys], 2 * keys + 1, 2 * keys)], axis=1)
+    cost = ctx.from_depot[states[0]].tolist()
+    steps = ctx.deadhead[states[:-1, :, None], states[1:, None, :]].tolist()
+    back = []
+    for step in steps:
+        choice = [0 if cost[0] + step[0][b] <= cost[1] + step[1][b] else 1 for b in (0, 1)]
+        cost = [cost[choice[b]] + step[choice[b]][b] for b in (0, 1)]
+        back.append(choice)
+    end = ctx.to_depot[states[-1]].tolist()
+    total = [cost[0] + end[0], cost[1] + end[1]]
+    state = 0 if total[0] <= total[1] else 1
+
+    current = calculate_route_cost(route, ctx) - int(ctx.cost[keys].sum())
+    saved = current - total[state]
+    if saved <= 0:
+        return route[:], 0
+    oriented = [0] * m
+    for i in range(m - 1, -1, -1):
+        oriented[i] = int(states[i, state])
+        if i > 0:
+            state = back[i - 1][state]
+    return oriented, saved
+
+def orient_routes(routes, ctx):
+    # orient em todas as rotas; devolve (rotas, deslocamento economizado)
+    result, saved = [], 0
+    for route in routes:
+        oriented, gain = orient(route, ctx)
+        result.append(oriented)
+        saved += gain
+    perfil.current().count('orient_saved', saved)
+    return result, saved
+
+def granular_neighbors(ctx, k):
+    # Vizinhança granular: para cada serviço, os k mais próximos (e os que o
+    # têm entre os seus k mais próximos). Com ela, two_opt e relocate só
+    # avaliam movimentos que criam ao menos uma ligação entre vizinhos.
+    near = ctx.nearest_services(k)
+    neighbors = [set(row) for row in near.tolist()]
+    for a, row in enumerate(near.tolist()):
+        for b in row:
+            neighbors[b].add(a)
+    return neighbors
+
+def two_opt(route, ctx, neighbors=None):
+    with perfil.current().phase('two_opt'):
+        return _two_opt(route, ctx, neighbors)
+
+def _two_opt(route, ctx, neighbors=None):
+    # 2-opt intra-rota: inverter o trecho route[lo..hi] também inverte o
+    # sentido das arestas obrigatórias dentro dele (arcos e nós mantêm o seu).
+    # Cada inversão é avaliada em O(1) com somas de prefixo dos deslocamentos
+    # internos nos dois sentidos; a rota só é alterada quando o movimento é
+    # aceito. Bits "don't look" evitam reexaminar serviços cuja vizinhança não
+    # mudou desde a última busca sem melhoria. Com neighbors (ver
+    # granular_neighbors), só as inversões que ligam o serviço a um vizinho
+    # ou ao depósito são avaliadas.
+    best = route[:]
+    m = len(best)
+    if m == 0:
+        return best, 0
+
+    # Submatriz de deslocamentos só com o depósito (posição 0) e as duas
+    # orientações de cada serviço da rota
+    tokens = sorted({x for t in best for x in (t, ctx.flip(t))})
+    local = {t: k + 1 for k, t in enumerate(tokens)}
+    d = ctx.local_matrix(tokens)
+    dep = 0
+
+    def prepare():
+        # Posição local de cada serviço no sentido atual (s) e invertido (r),
+        # e somas de prefixo dos deslocamentos internos: fwd[k] vai da posição
+        # 0 à k no sentido atual; rev[k] soma os mesmos trechos percorridos ao
+        # contrário, com cada serviço invertido.
+        s = [local[t] for t in best]
+        r = [local[ctx.flip(t)] for t in best]
+        fwd, rev = [0] * m, [0] * m
+        for k in range(1, m):
+            fwd[k] = fwd[k - 1] + d[s[k - 1]][s[k]]
+            rev[k] = rev[k - 1] + d[r[k]][r[k - 1]]
+        return s, r, fwd, rev
+
+    s, r, fwd, rev = prepare()
+    evaluated = accepted = 0
+    position = {t >> 1: k for k, t in enumerate(best)}
+    queue = deque(t >> 1 for t in best)
+    queued = set(queue)
+    while queue:
+        key = queue.popleft()
+        queued.discard(key)
+        i = position[key]
+        if neighbors is None:
+            moves = [(i, j) if i <= j else (j, i) for j in range(m)]
+        else:
+            moves = granular_moves(i, m, [position[b] for b in neighbors[key] if b in position])
+        evaluated += len(moves)
+        best_delta, best_move = 0, None
+        for lo, hi in moves:
+            prev = s[lo - 1] if lo > 0 else dep
+            nxt = s[hi + 1] if hi + 1 < m else dep
+            delta = (d[prev][r[hi]] + d[r[lo]][nxt] + rev[hi] - rev[lo]
+                     - d[prev][s[lo]] - d[s[hi]][nxt] - (fwd[hi] - fwd[lo]))
+            if delta < best_delta:
+                best_delta, best_move = delta, (lo, hi)
+        if best_move is None:
+            continue  # Bit "don't look" fica ligado até um vizinho mudar
+
+        lo, hi = best_move
+        accepted += 1
+        best[lo:hi + 1] = [ctx.flip(t) for t in reversed(best[lo:hi + 1])]
+        for k in range(lo, hi + 1):
+            position[best[k] >> 1] = k
+        s, r, fwd, rev = prepare()
+        # Reativa os extremos do movimento e o trecho invertido, cujos
+        # serviços mudaram de sentido
+        for k in range(max(lo - 1, 0), min(hi + 2, m)):
+            if best[k] >> 1 not in queued:
+                queue.append(best[k] >> 1)
+                queued.add(best[k] >> 1)
+
+    trace = perfil.current()
+    trace.count('two_opt_evaluated', evaluated)
+    trace.count('two_opt_accepted', accepted)
+    return best, calculate_route_cost(best, ctx)
+
+def granular_moves(i, m, near):
+    # Inversões (lo, hi) de uma rota com m serviços que põem o serviço da
+    # posição i ao lado de um vizinho (posições em near) ou do depósito
+    moves = {(0, i), (i, m - 1)}
+    for p in near:
+        if p > i:
+            moves.update(((i + 1, p), (i, p - 1)))
+        elif p < i:
+            moves.update(((p + 1, i), (p, i - 1)))
+    return sorted((lo, hi) for lo, hi in moves if lo <= hi)
+
+def relocate(routes, ctx, neighbors=None):
+    with perfil.current().phase('relocate'):
+        return _relocate(routes, ctx, neighbors)
+
+def _relocate(routes, ctx, neighbors=None):
+    # Realocação entre rotas: retira um serviço de uma rota e o insere na
+    # melhor posição (e, para arestas, no melhor sentido) de outra. A carga
+    # de cada rota fica em cache e a variação de custo de retirar ou inserir
+    # é avaliada em O(1) pelos vizinhos da posição. Os movimentos que melhoram
+    # vão para uma fila de prioridade e o melhor é aplicado primeiro; entradas
+    # de rotas que mudaram depois de enfileiradas são descartadas pela versão
+    # da rota, pois os serviços afetados são reavaliados a cada movimento.
+    # Com neighbors (ver granular_neighbors), um serviço só é inserido ao
+    # lado de um dos seus vizinhos.
+    routes = [route[:] for route in routes]
+    if len(routes) < 2:
+        return routes
+
+    # Deslocamentos entre todas as orientações dos serviços das rotas, com o
+    # depósito na posição 0
+    tokens = sorted({x for route in routes for t in route for x in (t, ctx.flip(t))})
+    local = {t: k + 1 for k, t in enumerate(tokens)}
+    d = ctx.local_matrix(tokens)
+    dep = 0
+    capacity = ctx.capacity
+    demand = ctx.demand_list
+    cost = ctx.cost_list
+
+    loads = [sum(demand[t >> 1] for t in route) for route in routes]
+    version = [0] * len(routes)
+    where = {t >> 1: r for r, route in enumerate(routes) for t in route}
+
+    def position(route, key):
+        return route.index(2 * key) if 2 * key in route else route.index(2 * key + 1)
+
+    def removal_delta(r, p):
+        route = routes[r]
+        x = local[route[p]]
+        prev = local[route[p - 1]] if p > 0 else dep
+        nxt = local[route[p + 1]] if p + 1 < len(route) else dep
+        return d[prev][nxt] - d[prev][x] - d[x][nxt] - cost[route[p] >> 1]
+
+    def best_insertion(t, target, positions):
+        # Melhor (variação, posição, orientação) para inserir t na rota
+        # target, entre as posições dadas
+        route = routes[target]
+        options = [t] if ctx.flip(t) == t else [t, ctx.flip(t)]
+        service_cost = cost[t >> 1]
+        best = None
+        for q in positions:
+            prev = local[route[q - 1]] if q > 0 else dep
+            nxt = local[route[q]] if q < len(route) else dep
+            base = d[prev][nxt]
+            for oriented in options:
+                x = local[oriented]
+                delta = d[prev][x] + service_cost + d[x][nxt] - base
+                if best is None or delta < best[0]:
+                    best = (delta, q, oriented)
+        return best
+
+    heap = []
+    counter = 0
+    evaluated = accepted = 0
+
+    def candidate_positions(key, targets):
+        # Destino -> posições de inserção a avaliar
+        if neighbors is None:
+            return {t: range(len(routes[t]) + 1) for t in targets}
+        targets = set(targets)
+        found = {}
+        for b in neighbors[key]:
+            t = where.get(b)
+            if t in targets:
+                q = position(routes[t], b)
+                found.setdefault(t, set()).update((q, q + 1))
+        return {t: sorted(qs) for t, qs in found.items()}
+
+    def push_best(key, targets):
+        nonlocal counter, evaluated
+        r = where[key]
+        p = position(routes[r], key)
+        removal = removal_delta(r, p)
+        for t, positions in candidate_positions(key, targets).items():
+            if t == r or not routes[t] or loads[t] + demand[key] > capacity:
+                continue
+            delta, q, oriented = best_insertion(routes[r][p], t, positions)
+            evaluated += len(positions)
+            if removal + delta < 0:
+                counter += 1
+                heapq.heappush(heap, (removal + delta, counter, key, r, version[r], t, version[t], q, oriented))
+
+    all_routes = range(len(routes))
+    for key in list(where):
+        push_best(key, all_routes)
+
+    while heap:
+        delta, _, key, r, ver_r, t, ver_t, q, oriented = heapq.heappop(heap)
+        if version[r] != ver_r or version[t] != ver_t:
+            continue
+
+        accepted += 1
+        route = routes[r]
+        del route[position(route, key)]
+        routes[t].insert(q, oriented)
+        loads[r] -= demand[key]
+        loads[t] += demand[key]
+        where[key] = t
+        version[r] += 1
+        version[t] += 1
+
+        # Serviços das duas rotas alteradas: todos os destinos; demais
+        # serviços: só os destinos que mudaram
+        changed = {x >> 1 for x in routes[r] + routes[t]}
+        for other in where:
+            push_best(other, all_routes if other in changed else (r, t))
+
+    trace = perfil.current()
+    trace.count('relocate_evaluated', evaluated)
+    trace.count('relocate_accepted', accepted)
+    return [route for route in routes if route]
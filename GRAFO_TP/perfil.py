@@ -0,0 +1,97 @@
+import cProfile
+import json
+import os
+import time
+from contextlib import contextmanager, nullcontext
+
+from cache import atomic_write
+
+# Instrumentação por fase: temporizadores (gerenciadores de contexto) e
+# contadores, agregados num rastro por instância que pode ser gravado em
+# JSON. As rotinas consultam o rastro ativo com current(); sem nenhum ativo
+# ele é um rastro nulo, cujos métodos não fazem nada, e os contadores são
+# somados em variáveis locais e registrados uma vez por chamada, então o
+# custo com a instrumentação desligada fica perto de zero.
+
+
+class Trace:
+    enabled = True
+
+    def __init__(self, name=None, profile=False):
+        self.name = name
+        self.timers = {}     # fase -> segundos (tempo de parede, acumulado)
+        self.cpu = {}        # fase -> segundos de CPU do processo
+        self.calls = {}      # fase -> nº de vezes que foi medida
+        self.counters = {}
+        self.clock = {}      # Marcas de time.process_time() do cabeçalho da solução
+        self.profiler = cProfile.Profile() if profile else None
+
+    @contextmanager
+    def phase(self, name):
+        start, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            self.timers[name] = self.timers.get(name, 0.0) + time.perf_counter() - start
+            self.cpu[name] = self.cpu.get(name, 0.0) + time.process_time() - cpu
+            self.calls[name] = self.calls.get(name, 0) + 1
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def mark(self, name):
+        self.clock[name] = time.process_time()
+        return self.clock[name]
+
+    def as_dict(self):
+        return {
+            'instance': self.name,
+            'timers': self.timers,
+            'cpu': self.cpu,
+            'calls': self.calls,
+            'counters': self.counters,
+            'clock': self.clock,
+        }
+
+    def write(self, path):
+        atomic_write(path, lambda f: f.write(json.dumps(self.as_dict(), indent=2).encode()))
+        if self.profiler is not None:
+            self.profiler.dump_stats(os.path.splitext(path)[0] + '.prof')
+
+
+class NullTrace:
+    enabled = False
+
+    def phase(self, name):
+        return _NULL_PHASE
+
+    def count(self, name, n=1):
+        pass
+
+    def mark(self, name):
+        return time.process_time()
+
+
+_NULL_PHASE = nullcontext()
+NULL_TRACE = NullTrace()
+_active = NULL_TRACE
+
+
+def current():
+    return _active
+
+
+@contextmanager
+def activate(trace):
+    # Torna `trace` o rastro ativo (e liga o cProfile, se pedido) durante o bloco
+    global _active
+    previous, _active = _active, trace if trace is not None else NULL_TRACE
+    profiler = getattr(trace, 'profiler', None)
+    if profiler is not None:
+        profiler.enable()
+    try:
+        yield trace
+    finally:
+        if profiler is not None:
+            profiler.disable()
+        _active = previous
@@ -0,0 +1,211 @@
+import argparse
+import os
+import re
+import sys
+import time
+
+import numpy as np
+
+import cache
+import instancia
+from caminhos import INF
+from etapa2 import shortest_paths
+
+INPUT_DIR = 'instancias'
+OUTPUT_DIR = 'solucoes'
+
+# Confere arquivos sol_*.dat (formato de etapa2.format_solution) contra a
+# instância e as distâncias do cache: cobertura dos serviços, extremos e
+# sentido de cada serviço, continuidade das rotas a partir do depósito e de
+# volta a ele, capacidade e custos declarados. Todas as verificações são
+# feitas de uma vez sobre arrays com todos os segmentos do arquivo.
+
+TOKEN = re.compile(r'\(([DS]) (\d+),(\d+),(\d+)\)')
+
+
+class ParsedSolution:
+    # Cabeçalho, uma linha por rota (carga, custo e nº de visitas declarados)
+    # e os segmentos de todas as rotas em colunas
+    def __init__(self):
+        self.cost = None
+        self.n_routes = None
+        self.loads = np.zeros(0, dtype=np.int64)
+        self.costs = np.zeros(0, dtype=np.int64)
+        self.visits = np.zeros(0, dtype=np.int64)
+        self.route = np.zeros(0, dtype=np.int64)       # Rota de cada segmento
+        self.is_service = np.zeros(0, dtype=bool)
+        self.ids = np.zeros(0, dtype=np.int64)         # Id do serviço (0 em deslocamentos)
+        self.tails = np.zeros(0, dtype=np.int64)       # Rótulos, como no arquivo
+        self.heads = np.zeros(0, dtype=np.int64)
+
+
+def parse_solution(text):
+    lines = text.splitlines()
+    if len(lines) < 4:
+        raise ValueError("Cabeçalho incompleto")
+    parsed = ParsedSolution()
+    parsed.cost = int(float(lines[0]))
+    parsed.n_routes = int(lines[1])
+
+    fields, tokens, counts = [], [], []
+    for number, line in enumerate(lines[4:], start=5):
+        if not line.strip():
+            continue
+        parts = line.split(None, 6)
+        if len(parts) < 6:
+            raise ValueError(f"Linha {number}: rota malformada")
+        found = TOKEN.findall(parts[6]) if len(parts) > 6 else []
+        fields.append(parts[:6])
+        tokens.extend(found)
+        counts.append(len(found))
+
+    header = np.array(fields, dtype=np.int64).reshape(-1, 6)
+    parsed.loads, parsed.costs, parsed.visits = header[:, 3], header[:, 4], header[:, 5]
+    parsed.route = np.repeat(np.arange(len(counts)), counts)
+    if tokens:
+        columns = np.array(tokens)
+        parsed.is_service = columns[:, 0] == 'S'
+        parsed.ids, parsed.tails, parsed.heads = columns[:, 1:].astype(np.int64).T
+    return parsed
+
+
+def check_solution(parsed, instance, dist):
+    # Lista de problemas encontrados (vazia se a solução é válida)
+    errors = []
+    n_routes = len(parsed.loads)
+    services = list(instance.services())
+    n_services = len(services)
+    s_kind = np.array([s[1] for s in services])
+    s_u = np.array([s[2] for s in services], dtype=np.int64)
+    s_v = np.array([s[3] for s in services], dtype=np.int64)
+    s_demand = np.array([s[4] for s in services], dtype=np.int64)
+    s_cost = np.array([s[5] for s in services], dtype=np.int64)
+
+    if parsed.n_routes != n_routes:
+        errors.append(f"Cabeçalho declara {parsed.n_routes} rotas, arquivo tem {n_routes}")
+    counts = np.bincount(parsed.route, minlength=n_routes)
+    bad = np.flatnonzero(counts != parsed.visits)
+    errors += [f"Rota {r + 1}: {parsed.visits[r]} visitas declaradas, {counts[r]} segmentos" for r in bad]
+
+    # Rótulos -> ids densos; rótulos desconhecidos viram -1
+    lookup = np.full(max(int(instance.labels.max()), int(parsed.tails.max(initial=0)),
+                         int(parsed.heads.max(initial=0))) + 1, -1, dtype=np.int64)
+    lookup[instance.labels] = np.arange(instance.n_nodes)
+    tails, heads = lookup[parsed.tails], lookup[parsed.heads]
+    unknown = np.flatnonzero((tails < 0) | (heads < 0))
+    errors += [f"Segmento {k + 1}: vértice inexistente" for k in unknown[:10]]
+    if unknown.size:
+        return errors
+
+    # Cobertura: cada serviço exatamente uma vez
+    ids = parsed.ids[parsed.is_service]
+    out_of_range = (ids < 1) | (ids > n_services)
+    if out_of_range.any():
+        errors.append(f"Ids de serviço inexistentes: {sorted(set(ids[out_of_range].tolist()))[:10]}")
+        return errors
+    seen = np.bincount(ids, minlength=n_services + 1)[1:]
+    missing, repeated = np.flatnonzero(seen == 0) + 1, np.flatnonzero(seen > 1) + 1
+    if missing.size:
+        errors.append(f"{missing.size} serviços não atendidos: {missing[:10].tolist()}")
+    if repeated.size:
+        errors.append(f"{repeated.size} serviços atendidos mais de uma vez: {repeated[:10].tolist()}")
+
+    # Extremos dos serviços: arestas podem ser atendidas nos dois sentidos
+    k = ids - 1
+    u, v = tails[parsed.is_service], heads[parsed.is_service]
+    forward = (u == s_u[k]) & (v == s_v[k])
+    backward = (u == s_v[k]) & (v == s_u[k]) & (s_kind[k] == 'E')
+    wrong = np.flatnonzero(~(forward | backward))
+    errors += [f"Serviço {ids[w]}: extremos ({parsed.tails[parsed.is_service][w]}, "
+               f"{parsed.heads[parsed.is_service][w]}) não conferem" for w in wrong[:10]]
+
+    # Continuidade: cada segmento começa onde o anterior da mesma rota
+    # terminou; a rota sai do depósito e volta a ele
+    if tails.size:
+        same_route = parsed.route[1:] == parsed.route[:-1]
+        broken = np.flatnonzero(same_route & (tails[1:] != heads[:-1]))
+        errors += [f"Rota {parsed.route[b + 1] + 1}: segmento {b + 2} não começa onde o anterior terminou"
+                   for b in broken[:10]]
+        first = np.flatnonzero(np.r_[True, ~same_route])
+        last = np.flatnonzero(np.r_[~same_route, True])
+        for r in parsed.route[first[tails[first] != instance.depot]]:
+            errors.append(f"Rota {r + 1}: não sai do depósito")
+        for r in parsed.route[last[heads[last] != instance.depot]]:
+            errors.append(f"Rota {r + 1}: não volta ao depósito")
+
+    # Capacidade e cargas declaradas
+    loads = np.bincount(parsed.route[parsed.is_service], weights=s_demand[k], minlength=n_routes).astype(np.int64)
+    for r in np.flatnonzero(loads > instance.capacity):
+        errors.append(f"Rota {r + 1}: carga {loads[r]} excede a capacidade {instance.capacity}")
+    for r in np.flatnonzero(loads != parsed.loads):
+        errors.append(f"Rota {r + 1}: carga declarada {parsed.loads[r]}, calculada {loads[r]}")
+
+    # Custos: deslocamento pela distância mínima, serviço pelo seu custo
+    deadhead = ~parsed.is_service
+    travel = np.asarray(dist[tails[deadhead], heads[deadhead]], dtype=np.int64)
+    if (travel >= INF).any():
+        errors.append("Deslocamento entre vértices sem caminho")
+        return errors
+    segment_cost = np.zeros(len(tails), dtype=np.int64)
+    segment_cost[deadhead] = travel
+    segment_cost[parsed.is_service] = s_cost[k]
+    costs = np.bincount(parsed.route, weights=segment_cost, minlength=n_routes).astype(np.int64)
+    for r in np.flatnonzero(costs != parsed.costs):
+        errors.append(f"Rota {r + 1}: custo declarado {parsed.costs[r]}, calculado {costs[r]}")
+    if int(costs.sum()) != parsed.cost:
+        errors.append(f"Custo total declarado {parsed.cost}, calculado {int(costs.sum())}")
+    return errors
+
+
+def verify_solution(text, instance_path):
+    instance = instancia.load_instance(instance_path)
+    dist, _, _ = cache.cached_shortest_paths(instance_path, 'custos', lambda: shortest_paths(instance))
+    try:
+        parsed = parse_solution(text)
+    except ValueError as e:
+        return [str(e)]
+    return check_solution(parsed, instance, dist)
+
+
+def instance_path_for(solution_path, input_dir=INPUT_DIR):
+    name = os.path.basename(solution_path)
+    return os.path.join(input_dir, name[len('sol_'):] if name.startswith('sol_') else name)
+
+
+def verify_directory(output_dir=OUTPUT_DIR, input_dir=INPUT_DIR):
+    # sol_<instância>.dat -> lista de problemas
+    results = {}
+    for name in sorted(os.listdir(output_dir)):
+        if not (name.startswith('sol_') and name.endswith('.dat')):
+            continue
+        instance_path = instance_path_for(name, input_dir)
+        if not os.path.exists(instance_path):
+            results[name] = [f"Instância {instance_path} não encontrada"]
+            continue
+        with open(os.path.join(output_dir, name)) as f:
+            results[name] = verify_solution(f.read(), instance_path)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Verifica as soluções sol_*.dat contra as instâncias')
+    parser.add_argument('output_dir', nargs='?', default=OUTPUT_DIR)
+    parser.add_argument('--input-dir', default=INPUT_DIR)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    results = verify_directory(args.output_dir, args.input_dir)
+    failed = {name: errors for name, errors in results.items() if errors}
+    for name, errors in failed.items():
+        print(f"❌ {name}")
+        for error in errors[:5]:
+            print(f"   {error}")
+        if len(errors) > 5:
+            print(f"   ... e mais {len(errors) - 5}")
+    print(f"{len(results) - len(failed)} válidas, {len(failed)} com problemas "
+          f"({time.perf_counter() - start:.2f} s)")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()